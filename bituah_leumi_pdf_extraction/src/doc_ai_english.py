@@ -1,43 +1,52 @@
 import os
-from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import DocumentAnalysisFeature
-from azure.core.credentials import AzureKeyCredential
 import sys
 import re
 from dotenv import load_dotenv
+# The Hebrew and checkbox OCR passes share one client (and its connections)
+from doc_ai_hebrew import get_document_client
 # Load environment variables
 load_dotenv()
 
+
+def submit_ocr(pdf_content):
+    """
+    Start Azure Document Intelligence OCR on a PDF without waiting for the result
+
+    Args:
+        pdf_content (bytes): The PDF file content
+
+    Returns:
+        LROPoller: Poller for the running analysis; result() returns the analyze result
+    """
+
+    client = get_document_client()
+
+    # Analyze the document using the layout model
+    return client.begin_analyze_document(
+        model_id="prebuilt-layout",
+        body=pdf_content,
+        # locale="he-IL",  # Hebrew locale
+        features=[
+            DocumentAnalysisFeature.OCR_HIGH_RESOLUTION,  # Better text recognition
+            DocumentAnalysisFeature.LANGUAGES,
+            ]
+    )
+
+
 def extract_text_from_pdf(pdf_content):
     """
     Extract text from PDF using Azure Document Intelligence OCR
 
     Args:
-        pdf_path (str): Path to the PDF file
-        endpoint (str): Azure Document Intelligence endpoint
-        api_key (str): Azure Document Intelligence API key
+        pdf_content (bytes): The PDF file content
 
     Returns:
         str: Extracted text content
     """
 
-    # Initialize the Document Intelligence client
-    client = DocumentIntelligenceClient(
-        endpoint=os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT"),
-        credential=AzureKeyCredential(os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY"))
-    )
-
     try:
-        # Analyze the document using the layout model
-        poller = client.begin_analyze_document(
-            model_id="prebuilt-layout",
-            body=pdf_content,
-            # locale="he-IL",  # Hebrew locale
-            features=[
-                DocumentAnalysisFeature.OCR_HIGH_RESOLUTION,  # Better text recognition
-                DocumentAnalysisFeature.LANGUAGES,
-                ]
-        )
+        poller = submit_ocr(pdf_content)
 
         # Get the result
         result = poller.result()
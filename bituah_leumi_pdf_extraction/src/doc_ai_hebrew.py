@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import DocumentAnalysisFeature
 from azure.core.credentials import AzureKeyCredential
@@ -8,35 +9,79 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# A whole line that mentions 'טלפון', the digit runs in it (with the spaces
+# OCR inserts between digits) and the non-digits to strip from a run
+_PHONE_LINE_RE = re.compile(r'[^\n]*טלפון[^\n]*')
+_PHONE_RUN_RE = re.compile(r'\d[\d\s]*')
+_NON_DIGIT_RE = re.compile(r'\D')
+
+# Single-character OCR noise removed in one pass
+_DELETE_TABLE = str.maketrans('', '', '|[]')
+
+# Multi-character markers, replaced in a single regex pass: the 'X' after 'חתימה'
+# (matching what replacing 'חתימה X' and then 'חתימהX' would do) and the
+# :selected: / :unselected: markers
+_SIGNATURE = 'חתימה'
+_MARKER_REPLACEMENTS = {
+    ':selected:': 'נבחר: ',
+    ':unselected:': 'לא נבחר: ',
+}
+_MARKER_RE = re.compile(_SIGNATURE + r'(?: XX?|X)|:selected:|:unselected:')
+
+# Everything from this marker onwards is dropped
+_PAGE_2_MARKER = "עמוד 2 מתוך 2"
+
+
+@lru_cache(maxsize=1)
+def get_document_client():
+    """
+    Create the Document Intelligence client once and reuse it, so its HTTP
+    connections stay open between documents (the client is thread-safe)
+    """
+    return DocumentIntelligenceClient(
+        endpoint=os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT"),
+        credential=AzureKeyCredential(os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")),
+        retry_total=5,  # Retry throttled (429) requests with backoff
+    )
+
+
+def submit_ocr(pdf_content):
+    """
+    Start Azure Document Intelligence OCR on a PDF without waiting for the result
+
+    Args:
+        pdf_content (bytes): The PDF file content
+
+    Returns:
+        LROPoller: Poller for the running analysis; result() returns the analyze result
+    """
+
+    client = get_document_client()
+
+    # Analyze the document using the layout model
+    return client.begin_analyze_document(
+        model_id="prebuilt-layout",
+        body=pdf_content,
+        locale="he-IL",  # Hebrew locale
+        features=[
+            DocumentAnalysisFeature.OCR_HIGH_RESOLUTION,  # Better text recognition
+            DocumentAnalysisFeature.LANGUAGES,]
+    )
+
+
 def extract_text_from_pdf(pdf_content):
     """
     Extract text from PDF using Azure Document Intelligence OCR
 
     Args:
-        pdf_path (str): Path to the PDF file
-        endpoint (str): Azure Document Intelligence endpoint
-        api_key (str): Azure Document Intelligence API key
+        pdf_content (bytes): The PDF file content
 
     Returns:
         str: Extracted text content
     """
 
-    # Initialize the Document Intelligence client
-    client = DocumentIntelligenceClient(
-        endpoint=os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT"),
-        credential=AzureKeyCredential(os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY"))
-    )
-
     try:
-        # Analyze the document using the layout model
-        poller = client.begin_analyze_document(
-            model_id="prebuilt-layout",
-            body=pdf_content,
-            locale="he-IL",  # Hebrew locale
-            features=[
-                DocumentAnalysisFeature.OCR_HIGH_RESOLUTION,  # Better text recognition
-                DocumentAnalysisFeature.LANGUAGES,]
-        )
+        poller = submit_ocr(pdf_content)
 
         # Get the result
         result = poller.result()
@@ -47,59 +92,70 @@ def extract_text_from_pdf(pdf_content):
         return None
 
 
+def fix_phone_digits(match):
+    """
+    Join the digits of a phone number OCR split with spaces and fix its first digit.
+
+    Args:
+        match (re.Match): A run of digits and whitespace on a phone line
+
+    Returns:
+        str: The digits only, starting with 0
+    """
+    digits = _NON_DIGIT_RE.sub('', match.group(0))
+
+    # Fix OCR error: phone numbers always start with 0, so a misread first digit becomes 0
+    # (the run always starts with a digit, so digits is never empty)
+    return '0' + digits[1:]
+
+
+def fix_phone_line(match):
+    """
+    Fix the phone numbers on a line that mentions 'טלפון'
+    """
+    return _PHONE_RUN_RE.sub(fix_phone_digits, match.group(0))
+
+
 def clean_document_text(text):
     """
     Clean document text by removing specific symbols and sections.
+    Every step is a single pass over the whole text (str.translate / re.sub)
+    instead of a Python loop over its lines.
 
     Args:
-        text (str): The input text to clean
+        text (str or iterable of str): The input text to clean, or its lines
 
     Returns:
         str: Cleaned text with symbols and sections removed
     """
-    # Remove the symbols |, [, and ]
-    cleaned_text = text.replace('|', '').replace('[', '').replace(']', '')
-
-    def fix_phone_numbers(text):
-        def process_phone_line(line):
-            if 'טלפון' in line:
-                # For phone lines: reverse digits and fix OCR errors
-                def fix_phone_digits(match):
-                    digits = re.findall(r'\d', match.group(0))
-
-                    # Fix OCR error: if first digit is 0, change to 6
-                    if digits and digits[0] != '0':
-                        digits[0] = '0'
-
-                    # ADD THIS LINE - return the processed digits
-                    return ''.join(digits)
-
-                return re.sub(r'\d[\d\s]*', fix_phone_digits, line)
-            else:
-                # Return the original line if it's not a phone line
-                return line
-
-        lines = text.split('\n')
-        processed_lines = [process_phone_line(line) for line in lines]
-        return '\n'.join(processed_lines)
-    # Remove 'X' after 'חתימה'
-    cleaned_text = cleaned_text.replace('חתימה X', 'חתימה')
-    cleaned_text = cleaned_text.replace('חתימהX', 'חתימה')
-    # Replace :selected: and :unselected: with Hebrew equivalents
-    # Newline before both markers
-    cleaned_text = cleaned_text.replace(':selected:', 'נבחר: ')
-    cleaned_text = cleaned_text.replace(':unselected:', 'לא נבחר: ')
-    # This puts the option and status on the same line:
-    cleaned_text = fix_phone_numbers(cleaned_text)
+    if not isinstance(text, str):
+        text = '\n'.join(text)
 
+    # Remove the symbols |, [, and ]
+    cleaned_text = text.translate(_DELETE_TABLE)
+
+    # Everything after "עמוד 2 מתוך 2" is removed below, so drop it now and let
+    # the passes skip page 2. Not done when the marker is on a phone line, since
+    # the phone fix can change the marker itself
+    marker_index = cleaned_text.find(_PAGE_2_MARKER)
+    if marker_index != -1:
+        line_start = cleaned_text.rfind('\n', 0, marker_index) + 1
+        line_end = cleaned_text.find('\n', marker_index)
+        marker_line = cleaned_text[line_start:line_end] if line_end != -1 else cleaned_text[line_start:]
+        if 'טלפון' not in marker_line:
+            cleaned_text = cleaned_text[:marker_index + len(_PAGE_2_MARKER)]
+
+    # Remove 'X' after 'חתימה' and replace the selection markers with Hebrew equivalents
+    cleaned_text = _MARKER_RE.sub(lambda match: _MARKER_REPLACEMENTS.get(match.group(0), _SIGNATURE), cleaned_text)
+    # For phone lines: reverse digits and fix OCR errors
+    cleaned_text = _PHONE_LINE_RE.sub(fix_phone_line, cleaned_text)
 
     # Find and remove everything from "עמוד 2 מתוך 2" onwards (including that line)
-    page_2_marker = "עמוד 2 מתוך 2"
-    page_2_index = cleaned_text.find(page_2_marker)
+    cleaned_text, page_2_found, _ = cleaned_text.partition(_PAGE_2_MARKER)
 
-    if page_2_index != -1:
+    if page_2_found:
         # Keep everything before "עמוד 2 מתוך 2"
-        cleaned_text = cleaned_text[:page_2_index].rstrip()
+        cleaned_text = cleaned_text.rstrip()
 
     return cleaned_text
 
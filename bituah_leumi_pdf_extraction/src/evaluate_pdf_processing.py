@@ -1,15 +1,35 @@
 import os
 import json
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple, Any
 
+try:
+    # orjson parses and writes JSON several times faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
 # Add the src directory to the path to import your modules
 sys.path.append('/Users/ormeiri/Desktop/KPMGassignment/KPMGasasignment/bituah_leumi_pdf_extraction/src')
 
-from doc_ai_hebrew import extract_text_from_pdf, clean_document_text
+from doc_ai_hebrew import extract_text_from_pdf, clean_document_text, submit_ocr
 from doc_ai_english import extract_text_from_pdf as extract_text_from_pdf_checkbox
-from gpt_field_extraction import extract_fields_from_ocr_text
+from doc_ai_english import submit_ocr as submit_ocr_checkbox
+from gpt_field_extraction import extract_fields_from_ocr_text, extract_fields_batch, needs_checkbox_ocr
+
+# OCR and GPT calls are remote I/O, so PDFs are processed concurrently
+MAX_WORKERS = 8
+
+# Start the checkbox OCR together with the regular OCR, so it is already done
+# when a form needs the fallback (costs one extra analysis per PDF that doesn't)
+SPECULATIVE_CHECKBOX_OCR = True
+
+# Marks a gold standard field that is absent from the extracted JSON
+_MISSING = object()
 
 
 def calculate_completeness(extracted_json: Dict, total_fields: int) -> float:
@@ -25,17 +45,15 @@ def calculate_completeness(extracted_json: Dict, total_fields: int) -> float:
     """
     filled_fields = 0
 
-    def count_filled_fields(obj, parent_key=""):
-        nonlocal filled_fields
+    stack = deque([extracted_json])
+    while stack:
+        obj = stack.pop()
         if isinstance(obj, dict):
-            for key, value in obj.items():
-                count_filled_fields(value, f"{parent_key}.{key}" if parent_key else key)
-        else:
-            # Count as filled if it's not empty string and not None
-            if obj and str(obj).strip():
-                filled_fields += 1
+            stack.extend(obj.values())
+        # Count as filled if it's not empty string and not None
+        elif obj and str(obj).strip():
+            filled_fields += 1
 
-    count_filled_fields(extracted_json)
     return filled_fields / total_fields if total_fields > 0 else 0.0
 
 
@@ -45,25 +63,93 @@ def count_total_fields(json_structure: Dict) -> int:
     """
     count = 0
 
-    def count_fields(obj):
-        nonlocal count
+    stack = deque([json_structure])
+    while stack:
+        obj = stack.pop()
         if isinstance(obj, dict):
-            for value in obj.values():
-                count_fields(value)
+            stack.extend(obj.values())
         else:
             count += 1
 
-    count_fields(json_structure)
     return count
 
 
-def compare_jsons_detailed(extracted_json: Dict, gold_json: Dict) -> Tuple[float, float, Dict]:
+def _flatten_json(json_structure: Dict) -> List[Tuple[Tuple[str, ...], Any]]:
+    """
+    Flatten a nested JSON dict into (key_path, value) leaves, depth-first in key order.
+    Empty dicts are kept as leaves so that a missing empty section is still reported.
+    """
+    leaves = []
+    stack = deque([((), json_structure)])
+    while stack:
+        key_path, obj = stack.pop()
+        if isinstance(obj, dict) and obj:
+            stack.extend(((*key_path, key), obj[key]) for key in reversed(list(obj)))
+        else:
+            leaves.append((key_path, obj))
+    return leaves
+
+
+def _get_nested(json_structure: Dict, key_path: Tuple[str, ...]) -> Any:
+    """Return the value at key_path in a nested dict"""
+    for key in key_path:
+        json_structure = json_structure[key]
+    return json_structure
+
+
+def read_json(path: str) -> Any:
+    """Read a UTF-8 JSON file, with orjson when it is installed"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json(path: str, data: Any):
+    """Write data as indented UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def _count_leaf_fields(leaves: List) -> int:
+    """Count the fields in flattened leaves (empty sections hold no fields)"""
+    return sum(1 for _, value in leaves if not isinstance(value, dict))
+
+
+def load_gold_standard(gold_json_path: str) -> Tuple[Dict, List, int]:
+    """
+    Load a gold standard JSON file, flattened and with its field count.
+    Results are cached by path and modification time, so each file is parsed
+    once per run but an edited file is picked up again.
+
+    Returns:
+        Tuple of (gold_json, gold_leaves, total_fields)
+    """
+    return _load_gold_standard(gold_json_path, os.path.getmtime(gold_json_path))
+
+
+@lru_cache(maxsize=64)
+def _load_gold_standard(gold_json_path: str, mtime: float) -> Tuple[Dict, List, int]:
+    gold_json = read_json(gold_json_path)
+    gold_leaves = _flatten_json(gold_json)
+    return gold_json, gold_leaves, _count_leaf_fields(gold_leaves)
+
+
+def compare_jsons_detailed(extracted_json: Dict, gold_json: Dict, gold_leaves: List = None,
+                           total_fields: int = None) -> Tuple[float, float, Dict]:
     """
     Compare two JSON objects with detailed analysis
 
     Args:
         extracted_json: The extracted JSON data
         gold_json: The gold standard JSON data
+        gold_leaves: Precomputed _flatten_json(gold_json), if available
+        total_fields: Precomputed number of gold standard fields, if available
 
     Returns:
         Tuple of (accuracy, completeness, mismatched_fields)
@@ -71,30 +157,49 @@ def compare_jsons_detailed(extracted_json: Dict, gold_json: Dict) -> Tuple[float
     if not isinstance(extracted_json, dict) or not isinstance(gold_json, dict):
         raise ValueError("Both inputs must be dictionaries.")
 
-    total_fields = count_total_fields(gold_json)
+    if gold_leaves is None:
+        gold_leaves = _flatten_json(gold_json)
+
+    if total_fields is None:
+        total_fields = _count_leaf_fields(gold_leaves)
     matching_fields = 0
     mismatched_fields = {}
 
-    def compare_nested(obj1, obj2, path=""):
-        nonlocal matching_fields, mismatched_fields
-
-        if isinstance(obj1, dict) and isinstance(obj2, dict):
-            for key in obj2:  # Use gold standard keys as reference
-                current_path = f"{path}.{key}" if path else key
-
-                if key not in obj1:
-                    mismatched_fields[current_path] = {
-                        'extracted': 'MISSING_FIELD',
-                        'gold': obj2[key],
-                        'type': 'missing_field'
-                    }
-                    continue
-
-                compare_nested(obj1[key], obj2[key], current_path)
+    # Use gold standard leaves as reference. A section that is missing (or is
+    # not a dict) in the extracted JSON is compared once as a whole, and the
+    # rest of its leaves are skipped.
+    skipped_path = None
+    for key_path, gold_value in gold_leaves:
+        if skipped_path is not None and key_path[:len(skipped_path)] == skipped_path:
+            continue
+
+        extracted_value = extracted_json
+        for depth, key in enumerate(key_path):
+            if not isinstance(extracted_value, dict):
+                key_path = skipped_path = key_path[:depth]
+                gold_value = _get_nested(gold_json, key_path)
+                break
+            if key not in extracted_value:
+                key_path = skipped_path = key_path[:depth + 1]
+                gold_value = _get_nested(gold_json, key_path)
+                extracted_value = _MISSING
+                break
+            extracted_value = extracted_value[key]
+
+        path = '.'.join(key_path)
+        if extracted_value is _MISSING:
+            mismatched_fields[path] = {
+                'extracted': 'MISSING_FIELD',
+                'gold': gold_value,
+                'type': 'missing_field'
+            }
+        elif isinstance(extracted_value, dict) and isinstance(gold_value, dict):
+            # Empty section in the gold standard
+            continue
         else:
             # Compare leaf values
-            extracted_val = str(obj1).strip() if obj1 else ""
-            gold_val = str(obj2).strip() if obj2 else ""
+            extracted_val = str(extracted_value).strip() if extracted_value else ""
+            gold_val = str(gold_value).strip() if gold_value else ""
 
             if extracted_val == gold_val:
                 matching_fields += 1
@@ -105,14 +210,62 @@ def compare_jsons_detailed(extracted_json: Dict, gold_json: Dict) -> Tuple[float
                     'type': 'value_mismatch'
                 }
 
-    compare_nested(extracted_json, gold_json)
-
     accuracy = matching_fields / total_fields if total_fields > 0 else 0.0
     completeness = calculate_completeness(extracted_json, total_fields)
 
     return accuracy, completeness, mismatched_fields
 
 
+def new_result(pdf_path: str) -> Dict:
+    """Create an empty result record for a PDF"""
+    return {
+        'pdf_file': os.path.basename(pdf_path),
+        'success': False,
+        'extracted_json': None,
+        'accuracy': 0.0,
+        'completeness': 0.0,
+        'mismatched_fields': {},
+        'error': None
+    }
+
+
+def merge_checkbox_fields(extracted_fields: Dict, extracted_fields_checkbox: Dict) -> Dict:
+    """Prefer the checkbox OCR fields, keeping the last name from the regular OCR if it was lost"""
+    if extracted_fields['lastName'] != "" and extracted_fields_checkbox['lastName'] == '':
+        extracted_fields_checkbox['lastName'] = extracted_fields['lastName']
+    return extracted_fields_checkbox
+
+
+def evaluate_result(result: Dict, extracted_fields: Dict, gold_json_path: str = None):
+    """Store the extracted fields in the result and score them against the gold standard if available"""
+    result['extracted_json'] = extracted_fields
+    result['success'] = True
+
+    if gold_json_path and os.path.exists(gold_json_path):
+        print("  📊 Evaluating against gold standard...")
+        gold_json, gold_leaves, total_fields = load_gold_standard(gold_json_path)
+
+        accuracy, completeness, mismatched_fields = compare_jsons_detailed(
+            extracted_fields, gold_json, gold_leaves, total_fields)
+        result['accuracy'] = accuracy
+        result['completeness'] = completeness
+        result['mismatched_fields'] = mismatched_fields
+    else:
+        # Calculate completeness even without gold standard
+        total_fields = count_total_fields(extracted_fields)
+        result['completeness'] = calculate_completeness(extracted_fields, total_fields)
+        print("  ⚠️  No gold standard found for comparison")
+
+
+def ocr_result_text(poller) -> str:
+    """Wait for a submitted OCR analysis and return its text (None if OCR failed)"""
+    try:
+        return poller.result().content
+    except Exception as e:
+        print(f"Error processing PDF: {str(e)}")
+        return None
+
+
 def process_single_pdf(pdf_path: str, gold_json_path: str = None) -> Dict:
     """
     Process a single PDF through the entire pipeline with hybrid OCR approach
@@ -124,15 +277,7 @@ def process_single_pdf(pdf_path: str, gold_json_path: str = None) -> Dict:
     Returns:
         Dictionary with processing results and metrics
     """
-    result = {
-        'pdf_file': os.path.basename(pdf_path),
-        'success': False,
-        'extracted_json': None,
-        'accuracy': 0.0,
-        'completeness': 0.0,
-        'mismatched_fields': {},
-        'error': None
-    }
+    result = new_result(pdf_path)
 
     try:
         print(f"\n📄 Processing: {os.path.basename(pdf_path)}")
@@ -141,6 +286,14 @@ def process_single_pdf(pdf_path: str, gold_json_path: str = None) -> Dict:
         with open(pdf_path, 'rb') as pdf_file:
             pdf_content = pdf_file.read()
 
+        # Start the checkbox OCR of the same bytes in the background
+        checkbox_poller = None
+        if SPECULATIVE_CHECKBOX_OCR:
+            try:
+                checkbox_poller = submit_ocr_checkbox(pdf_content)
+            except Exception as e:
+                print(f"  ⚠️  Could not start checkbox OCR early: {str(e)}")
+
         # Step 1a: Extract text from PDF using regular OCR
         print("  📖 Extracting text from PDF (regular OCR)...")
         extracted_text = extract_text_from_pdf(pdf_content)
@@ -155,38 +308,22 @@ def process_single_pdf(pdf_path: str, gold_json_path: str = None) -> Dict:
         print("  🤖 Extracting fields using AI (regular OCR)...")
         extracted_fields = extract_fields_from_ocr_text(cleaned_text)
 
-        if extracted_fields['lastName'].isascii() or extracted_fields['firstName'].isascii():
+        if needs_checkbox_ocr(extracted_fields):
             print("  📋 Extracting text from PDF (checkbox OCR)...")
-            extracted_text_checkbox = extract_text_from_pdf_checkbox(pdf_content)
+            if checkbox_poller is not None:
+                extracted_text_checkbox = ocr_result_text(checkbox_poller)
+            else:
+                extracted_text_checkbox = extract_text_from_pdf_checkbox(pdf_content)
             if not extracted_text_checkbox:
                 result['error'] = "Failed to extract text from PDF (checkbox OCR)"
                 return result
             cleaned_text_checkbox = clean_document_text(extracted_text_checkbox)
             print("  🤖 Extracting fields using AI (checkbox OCR)...")
             extracted_fields_checkbox = extract_fields_from_ocr_text(cleaned_text_checkbox)
-
-            if extracted_fields['lastName'] != "" and extracted_fields_checkbox['lastName'] == '':
-                extracted_fields_checkbox['lastName'] = extracted_fields['lastName']
-            extracted_fields = extracted_fields_checkbox
-
-        result['extracted_json'] = extracted_fields
-        result['success'] = True
+            extracted_fields = merge_checkbox_fields(extracted_fields, extracted_fields_checkbox)
 
         # Step 5: Evaluate against gold standard if available
-        if gold_json_path and os.path.exists(gold_json_path):
-            print("  📊 Evaluating against gold standard...")
-            with open(gold_json_path, 'r', encoding='utf-8') as f:
-                gold_json = json.load(f)
-
-            accuracy, completeness, mismatched_fields = compare_jsons_detailed(extracted_fields, gold_json)
-            result['accuracy'] = accuracy
-            result['completeness'] = completeness
-            result['mismatched_fields'] = mismatched_fields
-        else:
-            # Calculate completeness even without gold standard
-            total_fields = count_total_fields(extracted_fields)
-            result['completeness'] = calculate_completeness(extracted_fields, total_fields)
-            print("  ⚠️  No gold standard found for comparison")
+        evaluate_result(result, extracted_fields, gold_json_path)
 
     except Exception as e:
         result['error'] = str(e)
@@ -195,6 +332,115 @@ def process_single_pdf(pdf_path: str, gold_json_path: str = None) -> Dict:
     return result
 
 
+def process_pdfs_concurrently(jobs: List[Tuple[str, str]]):
+    """Process PDFs in a thread pool, yielding ((pdf_path, gold_json_path), result) as each one completes"""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(process_single_pdf, pdf_path, gold_path): (pdf_path, gold_path)
+                   for pdf_path, gold_path in jobs}
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def ocr_and_clean_all(pdf_paths: List[str], submit_ocr) -> List[str]:
+    """
+    OCR and clean many PDFs with the given submitter.
+
+    Every analysis is submitted before any result is awaited, so Azure runs
+    them side by side instead of one long-running operation at a time.
+
+    Returns:
+        List of cleaned texts in the same order as pdf_paths (None if OCR failed)
+    """
+    pollers = []
+    for pdf_path in pdf_paths:
+        try:
+            with open(pdf_path, 'rb') as pdf_file:
+                pollers.append(submit_ocr(pdf_file.read()))
+        except Exception as e:
+            print(f"Error processing PDF: {str(e)}")
+            pollers.append(None)
+
+    cleaned_texts = []
+    for poller in pollers:
+        extracted_text = ocr_result_text(poller) if poller is not None else None
+        cleaned_texts.append(clean_document_text(extracted_text) if extracted_text else None)
+    return cleaned_texts
+
+
+def process_pdfs_batch(jobs: List[Tuple[str, str]]) -> List[Dict]:
+    """
+    Process many PDFs with the hybrid OCR approach, sending all GPT extractions
+    through the Azure OpenAI Batch API instead of one call per PDF.
+
+    Pass 1 submits OCR for every PDF at once and cleans the results, pass 2
+    submits one batch job for all cleaned texts, and a final pass re-runs the
+    checkbox OCR (as one more batch job) for the PDFs that need it.
+
+    Args:
+        jobs: List of (pdf_path, gold_json_path) tuples
+
+    Returns:
+        List of result dictionaries, in the same order as jobs
+    """
+    results = [new_result(pdf_path) for pdf_path, _ in jobs]
+
+    # Pass 1: OCR and cleaning for all PDFs
+    print("\n📖 Extracting and cleaning text from all PDFs (regular OCR)...")
+    cleaned_texts = ocr_and_clean_all([pdf_path for pdf_path, _ in jobs], submit_ocr)
+
+    pending = []
+    for i, cleaned_text in enumerate(cleaned_texts):
+        if cleaned_text:
+            pending.append(i)
+        else:
+            results[i]['error'] = "Failed to extract text from PDF (regular OCR)"
+
+    # Pass 2: one batch job for all GPT extractions
+    print(f"🤖 Extracting fields using AI for {len(pending)} PDFs (batch)...")
+    batch_fields = extract_fields_batch([cleaned_texts[i] for i in pending])
+    extracted = {}
+    for i, fields in zip(pending, batch_fields):
+        if fields is None:
+            results[i]['error'] = "Failed to extract fields using AI"
+        else:
+            extracted[i] = fields
+
+    # Checkbox OCR fallback for forms whose names came back in English
+    fallback = [i for i, fields in extracted.items() if needs_checkbox_ocr(fields)]
+    if fallback:
+        print(f"📋 Extracting text from {len(fallback)} PDFs (checkbox OCR)...")
+        checkbox_texts = ocr_and_clean_all([jobs[i][0] for i in fallback], submit_ocr_checkbox)
+
+        checkbox_pending = []
+        for i, cleaned_text in zip(fallback, checkbox_texts):
+            if cleaned_text:
+                checkbox_pending.append((i, cleaned_text))
+            else:
+                results[i]['error'] = "Failed to extract text from PDF (checkbox OCR)"
+                del extracted[i]
+
+        print(f"🤖 Extracting fields using AI for {len(checkbox_pending)} PDFs (checkbox OCR, batch)...")
+        checkbox_fields = extract_fields_batch([text for _, text in checkbox_pending])
+        for (i, _), fields in zip(checkbox_pending, checkbox_fields):
+            if fields is None:
+                results[i]['error'] = "Failed to extract fields using AI (checkbox OCR)"
+                del extracted[i]
+            else:
+                extracted[i] = merge_checkbox_fields(extracted[i], fields)
+
+    # Evaluate against gold standards
+    for i, fields in extracted.items():
+        print(f"\n📄 Evaluating: {results[i]['pdf_file']}")
+        try:
+            evaluate_result(results[i], fields, jobs[i][1])
+        except Exception as e:
+            results[i]['error'] = str(e)
+            print(f"  ❌ Error: {str(e)}")
+
+    return results
+
+
 def print_detailed_results(result: Dict):
     """Print detailed results for a single file"""
     print(f"\n{'=' * 60}")
@@ -227,9 +473,13 @@ def print_detailed_results(result: Dict):
         print("✅ All fields match perfectly!")
 
 
-def run_evaluation():
+def run_evaluation(use_batch: bool = False):
     """
     Main evaluation function that processes all PDFs in the folder
+
+    Args:
+        use_batch: Send the GPT extractions through the Azure OpenAI Batch API
+            (cheaper, but results may take a while)
     """
 
     # Configuration
@@ -255,6 +505,11 @@ def run_evaluation():
     total_completeness = 0.0
     files_with_gold_standard = 0
 
+    # List the gold standards once instead of checking for each PDF
+    gold_files = {f for f in os.listdir(gold_folder) if f.endswith('_gold.json')}
+
+    # Build (pdf_path, gold_path) jobs up front
+    jobs = []
     for pdf_file in sorted(pdf_files):
         pdf_path = os.path.join(pdf_folder, pdf_file)
 
@@ -262,15 +517,26 @@ def run_evaluation():
         # Assuming naming convention: 283_ex1.pdf -> 283_ex1_gold.json
         base_name = os.path.splitext(pdf_file)[0]
         gold_file = f"{base_name}_gold.json"
-        gold_path = os.path.join(gold_folder, gold_file)
+        gold_path = None
 
-        if not os.path.exists(gold_path):
-            gold_path = None
-        else:
+        if gold_file in gold_files:
+            gold_path = os.path.join(gold_folder, gold_file)
             files_with_gold_standard += 1
 
-        # Process the PDF
-        result = process_single_pdf(pdf_path, gold_path)
+        jobs.append((pdf_path, gold_path))
+
+    # Load all gold standards concurrently before processing starts, so the
+    # evaluation of each PDF finds its gold standard already in memory
+    gold_paths = [gold_path for _, gold_path in jobs if gold_path]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(load_gold_standard, gold_paths))
+
+    if use_batch:
+        completed = zip(jobs, process_pdfs_batch(jobs))
+    else:
+        completed = process_pdfs_concurrently(jobs)
+
+    for (_, gold_path), result in completed:
         all_results.append(result)
 
         # Print detailed results
@@ -283,6 +549,9 @@ def run_evaluation():
             if gold_path:  # Only count accuracy if we have gold standard
                 total_accuracy += result['accuracy']
 
+    # Keep the saved results in a stable order
+    all_results.sort(key=lambda r: r['pdf_file'])
+
     # Print overall summary
     print("\n" + "=" * 70)
     print("📊 OVERALL EVALUATION SUMMARY")
@@ -305,8 +574,7 @@ def run_evaluation():
 
     # Save detailed results to JSON
     output_file = "/Users/ormeiri/Desktop/KPMGassignment/KPMGasasignment/evaluation_results_hybrid.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_results, f, indent=2, ensure_ascii=False)
+    write_json(output_file, all_results)
 
     print(f"\n💾 Detailed results saved to: {output_file}")
 
@@ -360,4 +628,4 @@ def run_evaluation():
 
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    run_evaluation(use_batch="--batch" in sys.argv[1:])
\ No newline at end of file
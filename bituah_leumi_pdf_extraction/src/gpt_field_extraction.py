@@ -1,25 +1,28 @@
+import hashlib
 import json
 import os
 import re
-from openai import AzureOpenAI
+import tempfile
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+DEPLOYMENT_NAME = "gpt-4o"  # or your deployment name
+# Batch jobs must target a Global-Batch deployment
+BATCH_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT", DEPLOYMENT_NAME)
 
-def extract_fields_from_ocr_text(ocr_text):
-    """
-    Simple function to extract fields from OCR text using Azure OpenAI
-    """
+# Extractions are cached on disk by OCR text, so re-running an evaluation
+# doesn't pay again for unchanged PDFs. Bump PROMPT_VERSION whenever the
+# prompt or output template changes to invalidate the cache.
+PROMPT_VERSION = "1"
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "gpt")
 
-    # Initialize Azure OpenAI client
-    client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+# JSON wrapped in a markdown code fence
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*\})\s*```', re.DOTALL)
 
-    prompt = """
+EXTRACTION_PROMPT = """
 You are extracting information from an Israeli National Insurance Institute (ביטוח לאומי) form.
 
 Extract the following fields from the OCR text and return ONLY a valid JSON object.
@@ -103,12 +106,7 @@ Here are detailed extraction rules to follow EXACTLY:
      * "הרמבם 16 1 12 אבן יהודה" → street="הרמבם", houseNumber="16", entrance="1", apartment="12"
      * "ראובן רובין 7 12 באר שבע" → street="ראובן רובין", houseNumber="7", entrance="", apartment="12"
 
-10. CRITICAL: Return the COMPLETE JSON structure with ALL fields
-    - NEVER remove any fields from the JSON structure, even if not found in the text. Leave empty fields as empty strings "" but keep the field in the JSON.
-    - The JSON structure must match the provided template exactly, with all fields present
-    - Never remove the field medicalDiagnoses in your answer, even if not found in the text. Leave it as an empty string "" if not found.
-    
-11. ONLY phone numbers always start with 0. If the first digit is not read as zero, change the first digit to zero (do not add an extra zero). Note: don't change numbers like ID only phone numbers!
+10. ONLY phone numbers always start with 0. If the first digit is not read as zero, change the first digit to zero (do not add an extra zero). Note: don't change numbers like ID only phone numbers!
 
 Look for these Hebrew/English field mappings:
 - שם משפחה / Last Name → lastName
@@ -136,9 +134,12 @@ Look for these Hebrew/English field mappings:
 - תאריך מילוי הטופס / Form Filling Date → formFillingDate (split into day, month, year)
 - תאריך קבלת הטופס בקופה / Form Receipt Date → formReceiptDateAtClinic (split into day, month, year)
 - Medical fields → medicalInstitutionFields
+"""
 
-Return this exact JSON structure:
-{
+
+# Output structure of the extraction. It is enforced through structured outputs
+# (every field is a string and always present) instead of being sent in the prompt.
+EXTRACTION_TEMPLATE = {
     "lastName": "",
     "firstName": "",
     "idNumber": "",
@@ -188,38 +189,251 @@ Return this exact JSON structure:
     }
 }
 
-OCR TEXT TO ANALYZE:
-"""
+
+def build_json_schema(template):
+    """
+    Build a strict JSON schema from a template dict whose leaves are strings
+    """
+    return {
+        "type": "object",
+        "properties": {
+            key: build_json_schema(value) if isinstance(value, dict) else {"type": "string"}
+            for key, value in template.items()
+        },
+        "required": list(template),
+        "additionalProperties": False
+    }
+
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "form_fields",
+        "strict": True,
+        "schema": build_json_schema(EXTRACTION_TEMPLATE)
+    }
+}
+
+
+@lru_cache(maxsize=1)
+def create_openai_client():
+    """
+    Create the Azure OpenAI client from environment variables.
+    The client is created once and shared (it is thread-safe), so HTTP
+    connections are kept alive between extractions.
+    """
+    # Imported here so that importing this module (e.g. for EXTRACTION_TEMPLATE)
+    # doesn't load the OpenAI SDK
+    from openai import AzureOpenAI
+
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        max_retries=5  # Rate limits are hit when PDFs are processed concurrently
+    )
+
+
+def build_request_body(ocr_text, model=DEPLOYMENT_NAME):
+    """
+    Build the chat completion request for a single OCR text
+    """
+    return {
+        "model": model,
+        "messages": [
+            # Keep the static instructions as an identical prefix on every request
+            # so Azure OpenAI can serve them from its prompt cache
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {"role": "user", "content": "OCR TEXT TO ANALYZE:\n" + ocr_text}
+        ],
+        "response_format": RESPONSE_FORMAT,
+        "temperature": 0.1,
+        "max_tokens": 2000
+    }
+
+
+def parse_extraction_response(content):
+    """
+    Parse the JSON object of a GPT response.
+    Structured outputs return plain JSON, so that is tried first; a ```json
+    fence and finally the outermost braces are only searched for as fallbacks.
+    """
+    if content is None:
+        print("No JSON found in response")
+        return None
+
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        pass
+
+    fence_match = _JSON_FENCE_RE.search(content)
+    if fence_match:
+        try:
+            return json.loads(fence_match.group(1))
+        except json.JSONDecodeError:
+            pass
+
+    start_idx = content.find('{')
+    end_idx = content.rfind('}') + 1
+    if start_idx != -1 and end_idx > start_idx:
+        try:
+            return json.loads(content[start_idx:end_idx])
+        except json.JSONDecodeError:
+            pass
+
+    print("No JSON found in response")
+    return None
+
+
+def needs_checkbox_ocr(fields):
+    """
+    Check whether a form should be re-read with the checkbox OCR model.
+    That is the case when a name was read in English letters; empty names
+    don't count, since an empty string would otherwise pass as ASCII.
+    """
+    for key in ('lastName', 'firstName'):
+        value = fields.get(key) or ''
+        if any(c.isascii() and c.isalpha() for c in value):
+            return True
+    return False
+
+
+def cache_path(ocr_text, model=DEPLOYMENT_NAME):
+    """
+    Path of the cached extraction for an OCR text by the given deployment
+    """
+    key = hashlib.sha256(f"{PROMPT_VERSION}:{model}:{ocr_text}".encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def load_cached_fields(ocr_text, model=DEPLOYMENT_NAME):
+    """
+    Return the cached extraction for an OCR text, or None if it isn't cached
+    """
+    try:
+        with open(cache_path(ocr_text, model), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def save_cached_fields(ocr_text, fields, model=DEPLOYMENT_NAME):
+    """
+    Store a successful extraction in the cache
+    """
+    if fields is None:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path(ocr_text, model), 'w', encoding='utf-8') as f:
+            json.dump(fields, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"Could not cache extraction: {e}")
+
+
+def extract_fields_from_ocr_text(ocr_text):
+    """
+    Simple function to extract fields from OCR text using Azure OpenAI
+    """
+    cached_fields = load_cached_fields(ocr_text)
+    if cached_fields is not None:
+        return cached_fields
+
+    # Initialize Azure OpenAI client
+    client = create_openai_client()
 
     # Make API call
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",  # or your deployment name
-            messages=[
-                {"role": "user", "content": prompt + ocr_text}
-            ],
-            temperature=0.1,
-            max_tokens=2000
-        )
+        response = client.chat.completions.create(**build_request_body(ocr_text))
 
         # Extract and parse JSON response
-        content = response.choices[0].message.content.strip()
+        fields = parse_extraction_response(response.choices[0].message.content)
+        save_cached_fields(ocr_text, fields)
+        return fields
 
-        # Try to extract JSON from response
-        start_idx = content.find('{')
-        end_idx = content.rfind('}') + 1
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
 
-        if start_idx != -1 and end_idx != -1:
-            json_str = content[start_idx:end_idx]
-            extracted_data = json.loads(json_str)
-            return extracted_data
-        else:
-            print("No JSON found in response")
-            return None
+
+def extract_fields_batch(ocr_texts, poll_interval=30):
+    """
+    Extract fields from many OCR texts with a single Azure OpenAI Batch job.
+    Batch requests are billed at a discount and skip the per-call HTTP overhead,
+    but may take a while to complete, so use this for offline evaluation only.
+    Texts that already have a cached extraction are not sent.
+
+    Args:
+        ocr_texts (list[str]): Cleaned OCR texts to extract fields from
+        poll_interval (int): Seconds to wait between batch status checks
+
+    Returns:
+        list[dict]: Extracted fields aligned to the input order (None where extraction failed)
+    """
+    results = [load_cached_fields(ocr_text, BATCH_DEPLOYMENT_NAME) for ocr_text in ocr_texts]
+    pending = [i for i, fields in enumerate(results) if fields is None]
+    if not pending:
+        return results
+
+    client = create_openai_client()
+
+    try:
+        # Write one request per line, keyed by its position in the input
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as f:
+            for i in pending:
+                ocr_text = ocr_texts[i]
+                line = {
+                    "custom_id": f"pdf_{i}",
+                    "method": "POST",
+                    "url": "/chat/completions",
+                    "body": build_request_body(ocr_text, model=BATCH_DEPLOYMENT_NAME)
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+            batch_input_path = f.name
+
+        try:
+            with open(batch_input_path, 'rb') as f:
+                batch_file = client.files.create(file=f, purpose="batch")
+        finally:
+            os.remove(batch_input_path)
+
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/chat/completions",
+            completion_window="24h"
+        )
+        print(f"Submitted batch {batch.id} with {len(pending)} requests "
+              f"({len(ocr_texts) - len(pending)} served from cache)")
+
+        # Poll until the batch reaches a terminal state
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            print(f"Batch {batch.id} ended with status: {batch.status}")
+            return results
+
+        # Parse the output file and realign it to the input order
+        output = client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            index = int(item["custom_id"].split('_')[-1])
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                print(f"Request {item['custom_id']} failed: {item.get('error')}")
+                continue
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[index] = parse_extraction_response(content)
+            save_cached_fields(ocr_texts[index], results[index], BATCH_DEPLOYMENT_NAME)
 
     except Exception as e:
         print(f"Error: {e}")
-        return None
+
+    return results
 
 
 def main():
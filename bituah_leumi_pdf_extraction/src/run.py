@@ -1,82 +1,344 @@
 import streamlit as st
+import hashlib
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 
-# Import your custom functions
-from doc_ai_hebrew import extract_text_from_pdf, clean_document_text
-from doc_ai_english import extract_text_from_pdf as extract_text_from_pdf_checkbox
-from gpt_field_extraction import extract_fields_from_ocr_text
+# Import your custom functions. The OCR and OpenAI SDKs are only imported once
+# a PDF is processed (in process_pdf / extract_checkbox_text), so the landing
+# page renders without loading them.
+from gpt_field_extraction import (extract_fields_from_ocr_text, needs_checkbox_ocr, EXTRACTION_TEMPLATE,
+                                  PROMPT_VERSION, DEPLOYMENT_NAME)
 
-def display_json_fields(json_data, parent_key=""):
+try:
+    # orjson serializes and parses JSON several times faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def to_pretty_json(data):
+    """
+    Indented UTF-8 JSON string for display, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def parse_json(data):
+    """
+    Parse a JSON str or bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Rendered once at import instead of on every Streamlit rerun
+EXAMPLE_JSON_STR = to_pretty_json(EXTRACTION_TEMPLATE)
+FOOTER_HTML = """
+        <div style='text-align: center'>
+            <p>PDF Field Extraction Tool - Powered by AI</p>
+        </div>
+        """
+
+# Display names for nested object headers
+_CUSTOM_HEADERS = {
+    'dateOfBirth': "Date Of Birth",
+    'dateOfInjury': "Date Of Injury",
+    'formFillingDate': "Form Filling Date",
+    'formReceiptDateAtClinic': "Form Receipt Date At Clinic",
+    'medicalInstitutionFields': "Medical Institution Fields",
+    'address': "Address",
+}
+
+# More readable labels for field keys
+_CUSTOM_LABELS = {
+    'lastName': "Last Name",
+    'firstName': "First Name",
+    'idNumber': "ID Number",
+    'dateOfBirth': "Date of Birth",
+    'landlinePhone': "Landline Phone",
+    'mobilePhone': "Mobile Phone",
+    'jobType': "Job Type",
+    'timeOfInjury': "Time of Injury",
+    'accidentLocation': "Accident Location",
+    'accidentAddress': "Accident Address",
+    'accidentDescription': "Accident Description",
+    'injuredBodyPart': "Injured Body Part",
+    'houseNumber': "House Number",
+    'postalCode': "Postal Code",
+    'poBox': "PO Box",
+    'healthFundMember': "Health Fund Member",
+    'natureOfAccident': "Nature of Accident",
+    'medicalDiagnoses': "Medical Diagnoses",
+}
+
+
+# Upper bound on PDFs processed at the same time when several are uploaded
+MAX_WORKERS = 8
+
+# Results of processed PDFs, keyed by a hash of the file content, so uploading
+# the same PDF again skips the OCR and GPT calls. The key also covers the
+# prompt version and deployment; bump RESULT_CACHE_VERSION whenever the OCR or
+# text cleaning changes to invalidate the cache.
+RESULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "pdf")
+RESULT_CACHE_VERSION = "1"
+
+
+def result_cache_path(pdf_content):
+    """
+    Path of the cached processing result for a PDF (bytes or any buffer, e.g. a memoryview)
+    """
+    key = hashlib.blake2b(pdf_content, digest_size=16)
+    key.update(f"{RESULT_CACHE_VERSION}:{PROMPT_VERSION}:{DEPLOYMENT_NAME}".encode('utf-8'))
+    key = key.hexdigest()
+    return os.path.join(RESULT_CACHE_DIR, f"{key}.json")
+
+
+def load_cached_result(cache_file):
+    """
+    Load a cached processing result, or None if the PDF wasn't processed before
+    or the cached file isn't a valid result
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_result = parse_json(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached_result, dict) or not {"extracted_fields", "cleaned_text"} <= cached_result.keys():
+        return None
+    return cached_result
+
+
+def save_cached_result(cache_file, extracted_fields, cleaned_text):
+    """
+    Store a processing result in the cache
+    """
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            f.write(to_pretty_json({"extracted_fields": extracted_fields, "cleaned_text": cleaned_text}))
+    except OSError as e:
+        print(f"Could not cache result: {e}")
+
+
+@lru_cache(maxsize=8)
+def extract_checkbox_text(pdf_content):
+    """
+    Run the checkbox OCR on a PDF and clean the text, cached per PDF content
+    """
+    from doc_ai_hebrew import clean_document_text
+    from doc_ai_english import extract_text_from_pdf as extract_text_from_pdf_checkbox
+
+    return clean_document_text(extract_text_from_pdf_checkbox(pdf_content))
+
+
+def filled_in_hebrew(extracted_fields):
+    """
+    Check whether the form details besides the names were read in Hebrew.
+    The checkbox OCR pass is for forms filled in English, so it is skipped
+    for these even if a name came back in English letters.
+    """
+    details = (extracted_fields.get('idNumber') or '') + (extracted_fields.get('accidentDescription') or '')
+    return any(ord(c) > 127 for c in details)
+
+
+def process_pdf(pdf_content, report=st.write):
+    """
+    Run the hybrid OCR pipeline on a PDF.
+    The checkbox OCR is started in the background together with the regular
+    OCR, and its text is only used if the form needs the fallback.
+
+    Args:
+        pdf_content (bytes): The PDF file content
+        report: Called with each progress message (st.write by default; worker
+            threads can't write to the page, so they pass print)
+
+    Returns:
+        tuple: (extracted_fields, cleaned_text)
     """
-    Recursively display JSON fields in a user-friendly format
+    from doc_ai_hebrew import extract_text_from_pdf, clean_document_text
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    checkbox_future = executor.submit(extract_checkbox_text, pdf_content)
+    try:
+        # Step 1: Extract text from PDF
+        report("📖 Extracting text from PDF...")
+        extracted_text = extract_text_from_pdf(pdf_content)
+        report("🧹 Cleaning extracted text...")
+        cleaned_text = clean_document_text(extracted_text)
+        report("🤖 Extracting fields using AI...")
+        extracted_fields = extract_fields_from_ocr_text(cleaned_text)
+        if needs_checkbox_ocr(extracted_fields) and not filled_in_hebrew(extracted_fields):
+            cleaned_text_checkbox = checkbox_future.result()
+            extracted_fields_checkbox = extract_fields_from_ocr_text(cleaned_text_checkbox)
+            if extracted_fields['lastName'] != "" and extracted_fields_checkbox['lastName'] == '':
+                extracted_fields_checkbox['lastName'] = extracted_fields['lastName']
+            extracted_fields = extracted_fields_checkbox
+    finally:
+        # Don't wait for the checkbox OCR if its text isn't needed
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return extracted_fields, cleaned_text
+
+
+def process_uploaded_files(uploaded_files):
     """
-    for key, value in json_data.items():
-        if isinstance(value, dict):
-            # Display nested object header
-            header_text = key.replace('_', ' ').title()
-            if key == 'dateOfBirth':
-                header_text = "Date Of Birth"
-            elif key == 'dateOfInjury':
-                header_text = "Date Of Injury"
-            elif key == 'formFillingDate':
-                header_text = "Form Filling Date"
-            elif key == 'formReceiptDateAtClinic':
-                header_text = "Form Receipt Date At Clinic"
-            elif key == 'medicalInstitutionFields':
-                header_text = "Medical Institution Fields"
-            elif key == 'address':
-                header_text = "Address"
-
-            st.subheader(header_text)
-            display_json_fields(value, key)
+    Process several uploaded PDFs at once. Cached PDFs are loaded directly and
+    the rest run through the pipeline concurrently, so their OCR and GPT
+    round trips overlap instead of adding up.
+
+    Returns:
+        dict: file name -> (extracted_fields, cleaned_text), or the exception
+            raised while processing that file
+    """
+    results = {}
+    pending = {}
+    for uploaded_file in uploaded_files:
+        # Hash the upload through a zero-copy view of its buffer
+        with uploaded_file.getbuffer() as pdf_view:
+            cache_file = result_cache_path(pdf_view)
+
+        cached_result = load_cached_result(cache_file)
+        if cached_result:
+            st.write(f"⚡ {uploaded_file.name}: loaded results from cache")
+            results[uploaded_file.name] = (cached_result["extracted_fields"], cached_result["cleaned_text"])
         else:
-            # Create a more readable label
-            if key == 'lastName':
-                label = "Last Name"
-            elif key == 'firstName':
-                label = "First Name"
-            elif key == 'idNumber':
-                label = "ID Number"
-            elif key == 'dateOfBirth':
-                label = "Date of Birth"
-            elif key == 'landlinePhone':
-                label = "Landline Phone"
-            elif key == 'mobilePhone':
-                label = "Mobile Phone"
-            elif key == 'jobType':
-                label = "Job Type"
-            elif key == 'timeOfInjury':
-                label = "Time of Injury"
-            elif key == 'accidentLocation':
-                label = "Accident Location"
-            elif key == 'accidentAddress':
-                label = "Accident Address"
-            elif key == 'accidentDescription':
-                label = "Accident Description"
-            elif key == 'injuredBodyPart':
-                label = "Injured Body Part"
-            elif key == 'houseNumber':
-                label = "House Number"
-            elif key == 'postalCode':
-                label = "Postal Code"
-            elif key == 'poBox':
-                label = "PO Box"
-            elif key == 'healthFundMember':
-                label = "Health Fund Member"
-            elif key == 'natureOfAccident':
-                label = "Nature of Accident"
-            elif key == 'medicalDiagnoses':
-                label = "Medical Diagnoses"
+            # Get PDF content as bytes (the OCR client needs bytes, and both
+            # OCR passes share this one copy)
+            pending[uploaded_file.name] = (uploaded_file.getvalue(), cache_file)
+
+    if len(pending) == 1:
+        # A single PDF runs here so its progress is shown on the page
+        name, (pdf_content, cache_file) = next(iter(pending.items()))
+        try:
+            results[name] = process_pdf(pdf_content)
+        except Exception as e:
+            results[name] = e
+    elif pending:
+        st.write(f"📚 Processing {len(pending)} PDFs in parallel...")
+        # The OCR and OpenAI clients are shared, so the workers reuse their connections
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(pending))) as executor:
+            futures = {
+                name: executor.submit(process_pdf, pdf_content, print)
+                for name, (pdf_content, _) in pending.items()
+            }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+
+    for name, (_, cache_file) in pending.items():
+        result = results[name]
+        if not isinstance(result, Exception) and result[0]:
+            save_cached_result(cache_file, *result)
+
+    # Keep the upload order
+    return {uploaded_file.name: results[uploaded_file.name] for uploaded_file in uploaded_files}
+
+
+def default_label(key):
+    """
+    Default formatting for keys without an explicit label
+    """
+    return key.replace('_', ' ').title()
+
+
+def build_label_maps(template):
+    """
+    Resolve the header and label of every key in the template once, so that
+    displaying a field is a single dict lookup
+    """
+    headers = dict(_CUSTOM_HEADERS)
+    labels = dict(_CUSTOM_LABELS)
+    stack = [template]
+    while stack:
+        obj = stack.pop()
+        for key, value in obj.items():
+            if isinstance(value, dict):
+                headers.setdefault(key, default_label(key))
+                stack.append(value)
             else:
-                # Default formatting for other fields
-                label = key.replace('_', ' ').title()
+                labels.setdefault(key, default_label(key))
+    return MappingProxyType(headers), MappingProxyType(labels)
+
+
+HEADER_MAP, LABEL_MAP = build_label_maps(EXTRACTION_TEMPLATE)
+
+
+def display_json_fields(json_data):
+    """
+    Display JSON fields in a user-friendly format.
+    Nested objects are walked with an explicit stack of item iterators instead
+    of recursion, which keeps the fields in document order under their header.
+    """
+    stack = [iter(json_data.items())]
+    while stack:
+        for key, value in stack[-1]:
+            if isinstance(value, dict):
+                # Display nested object header, then continue inside the object
+                st.subheader(HEADER_MAP.get(key) or default_label(key))
+                stack.append(iter(value.items()))
+                break
+
+            label = LABEL_MAP.get(key) or default_label(key)
 
             # Display the field with its value
-            if value:
-                st.write(f"**{label}:** {value}")
-            else:
-                st.write(f"**{label}:** *Not found*")
+            st.write(f"**{label}:** {value if value else '*Not found*'}")
+        else:
+            stack.pop()
+
+
+def display_result(extracted_fields, cleaned_text, json_str):
+    """
+    Show the result of one PDF in the structured, JSON and raw text tabs.
+    json_str is the formatted JSON, rendered once when the result was stored.
+    """
+    # Add tabs for different views
+    tab1, tab2, tab3 = st.tabs(["📋 Structured View", "📝 JSON View", "📄 Raw Text"])
+
+    with tab1:
+        st.subheader("Extracted Information")
+
+        # Parse JSON if it's a string
+        if isinstance(extracted_fields, str):
+            try:
+                json_data = parse_json(extracted_fields)
+            except json.JSONDecodeError:
+                st.error("Error parsing JSON data")
+                json_data = {}
+        else:
+            json_data = extracted_fields
+
+        # Display fields in a structured format
+        if json_data:
+            display_json_fields(json_data)
+        else:
+            st.warning("No fields were extracted from the document")
+
+    with tab2:
+        st.subheader("Raw JSON Output")
+
+        # Display JSON with syntax highlighting
+        st.code(json_str, language='json')
+
+    with tab3:
+        if cleaned_text is not None:
+            st.subheader("Cleaned Text")
+            st.text_area(
+                "Extracted and cleaned text from PDF:",
+                value=cleaned_text,
+                height=400,
+                disabled=True
+            )
+        else:
+            st.info("No cleaned text available")
 
 
 def main():
@@ -86,8 +348,11 @@ def main():
         layout="wide"
     )
 
+    # Initialize session state: file name -> (extracted_fields, cleaned_text, formatted JSON)
+    st.session_state.setdefault("results", {})
+
     st.title("📄 PDF Field Extraction Tool")
-    st.markdown("Upload a PDF file to extract structured information using AI")
+    st.markdown("Upload PDF files to extract structured information using AI")
 
     # Create two columns for better layout
     col1, col2 = st.columns([1, 2])
@@ -96,15 +361,17 @@ def main():
         st.header("Upload PDF")
 
         # File uploader
-        uploaded_file = st.file_uploader(
-            "Choose a PDF file",
+        uploaded_files = st.file_uploader(
+            "Choose PDF files",
             type=['pdf'],
-            help="Upload a PDF document to extract fields from"
+            accept_multiple_files=True,
+            help="Upload one or more PDF documents to extract fields from"
         )
 
-        if uploaded_file is not None:
-            st.success(f"File uploaded: {uploaded_file.name}")
-            st.info(f"File size: {uploaded_file.size} bytes")
+        if uploaded_files:
+            st.success(f"Files uploaded: {len(uploaded_files)}")
+            for uploaded_file in uploaded_files:
+                st.info(f"{uploaded_file.name}: {uploaded_file.size} bytes")
 
             # Process button
             process_button = st.button(
@@ -115,152 +382,48 @@ def main():
 
             if process_button:
                 with st.spinner("Processing PDF... This may take a few moments."):
-                    try:
-                        # Get PDF content as bytes
-                        pdf_content = uploaded_file.getvalue()
-
-                        # Step 1: Extract text from PDF
-                        st.write("📖 Extracting text from PDF...")
-                        extracted_text = extract_text_from_pdf(pdf_content)
-                        st.write("🧹 Cleaning extracted text...")
-                        cleaned_text = clean_document_text(extracted_text)
-                        st.write("🤖 Extracting fields using AI...")
-                        extracted_fields = extract_fields_from_ocr_text(cleaned_text)
-                        if extracted_fields['lastName'].isascii() or extracted_fields['firstName'].isascii():
-                            extracted_text_checkbox = extract_text_from_pdf_checkbox(pdf_content)
-                            cleaned_text_checkbox = clean_document_text(extracted_text_checkbox)
-                            extracted_fields_checkbox = extract_fields_from_ocr_text(cleaned_text_checkbox)
-                            if extracted_fields['lastName'] != "" and extracted_fields_checkbox['lastName'] == '':
-                                extracted_fields_checkbox['lastName'] = extracted_fields['lastName']
-                            extracted_fields = extracted_fields_checkbox
-
-                        # Store results in session state
-                        st.session_state.extracted_fields = extracted_fields
-                        st.session_state.cleaned_text = cleaned_text
-
-                        st.success("✅ Processing completed successfully!")
-
-                    except Exception as e:
-                        st.error(f"❌ Error processing PDF: {str(e)}")
+                    results = process_uploaded_files(uploaded_files)
+
+                # Store results in session state
+                st.session_state.results = {}
+                for name, result in results.items():
+                    if isinstance(result, Exception):
+                        st.error(f"❌ Error processing {name}: {str(result)}")
+                    else:
+                        extracted_fields, cleaned_text = result
+                        # Format the JSON view once here instead of on every rerun
+                        if isinstance(extracted_fields, str):
+                            json_str = extracted_fields
+                        else:
+                            json_str = to_pretty_json(extracted_fields)
+                        st.session_state.results[name] = (extracted_fields, cleaned_text, json_str)
+
+                if st.session_state.results:
+                    st.success("✅ Processing completed successfully!")
 
     with col2:
         st.header("Extracted Fields")
 
         # Display results if available
-        if hasattr(st.session_state, 'extracted_fields') and st.session_state.extracted_fields:
-
-            # Add tabs for different views
-            tab1, tab2, tab3 = st.tabs(["📋 Structured View", "📝 JSON View", "📄 Raw Text"])
-
-            with tab1:
-                st.subheader("Extracted Information")
-
-                # Parse JSON if it's a string
-                if isinstance(st.session_state.extracted_fields, str):
-                    try:
-                        json_data = json.loads(st.session_state.extracted_fields)
-                    except json.JSONDecodeError:
-                        st.error("Error parsing JSON data")
-                        json_data = {}
-                else:
-                    json_data = st.session_state.extracted_fields
-
-                # Display fields in a structured format
-                if json_data:
-                    display_json_fields(json_data)
-                else:
-                    st.warning("No fields were extracted from the document")
-
-            with tab2:
-                st.subheader("Raw JSON Output")
-
-                # Display JSON with syntax highlighting
-                if isinstance(st.session_state.extracted_fields, str):
-                    json_str = st.session_state.extracted_fields
-                else:
-                    json_str = json.dumps(st.session_state.extracted_fields, indent=2, ensure_ascii=False)
-
-                st.code(json_str, language='json')
-
-            with tab3:
-                if hasattr(st.session_state, 'cleaned_text'):
-                    st.subheader("Cleaned Text")
-                    st.text_area(
-                        "Extracted and cleaned text from PDF:",
-                        value=st.session_state.cleaned_text,
-                        height=400,
-                        disabled=True
-                    )
-                else:
-                    st.info("No cleaned text available")
+        results = {name: result for name, result in st.session_state.results.items() if result[0]}
+        if len(results) == 1:
+            display_result(*next(iter(results.values())))
+        elif results:
+            # One tab per PDF
+            for file_tab, result in zip(st.tabs(list(results)), results.values()):
+                with file_tab:
+                    display_result(*result)
 
         else:
-            st.info("👆 Upload a PDF file and click 'Process PDF' to see extracted fields here")
+            st.info("👆 Upload PDF files and click 'Process PDF' to see extracted fields here")
 
             # Show example JSON structure
             st.subheader("Expected JSON Structure")
-            example_json = {
-                "lastName": "",
-                "firstName": "",
-                "idNumber": "",
-                "gender": "",
-                "dateOfBirth": {
-                    "day": "",
-                    "month": "",
-                    "year": ""
-                },
-                "address": {
-                    "street": "",
-                    "houseNumber": "",
-                    "entrance": "",
-                    "apartment": "",
-                    "city": "",
-                    "postalCode": "",
-                    "poBox": ""
-                },
-                "landlinePhone": "",
-                "mobilePhone": "",
-                "jobType": "",
-                "dateOfInjury": {
-                    "day": "",
-                    "month": "",
-                    "year": ""
-                },
-                "timeOfInjury": "",
-                "accidentLocation": "",
-                "accidentAddress": "",
-                "accidentDescription": "",
-                "injuredBodyPart": "",
-                "signature": "",
-                "formFillingDate": {
-                    "day": "",
-                    "month": "",
-                    "year": ""
-                },
-                "formReceiptDateAtClinic": {
-                    "day": "",
-                    "month": "",
-                    "year": ""
-                },
-                "medicalInstitutionFields": {
-                    "healthFundMember": "",
-                    "natureOfAccident": "",
-                    "medicalDiagnoses": ""
-                }
-            }
-
-            st.code(json.dumps(example_json, indent=2), language='json')
+            st.code(EXAMPLE_JSON_STR, language='json')
 
     # Footer
     st.markdown("---")
-    st.markdown(
-        """
-        <div style='text-align: center'>
-            <p>PDF Field Extraction Tool - Powered by AI</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,9 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
-from datetime import datetime
+from collections import deque
+from itertools import islice
 from typing import List, Dict
 import subprocess
 import threading
@@ -9,6 +11,12 @@ import time
 import os
 import sys
 
+try:
+    # orjson encodes and decodes the chat payloads faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure page
 st.set_page_config(
     page_title="Medical HMO Chatbot",
@@ -16,34 +24,74 @@ st.set_page_config(
     layout="wide"
 )
 
+# Reruns from the chat area are scoped to it with st.fragment where this
+# Streamlit version supports it; older versions rerun the whole page
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
 # API Configuration
 API_BASE_URL = "http://localhost:8000"
+# Only the most recent messages are sent to the backend with each turn
+HISTORY_WINDOW = 20
+
+@st.cache_resource
+def get_http_session():
+    """
+    Shared HTTP session for calls to the backend. Cached as a resource so it
+    survives Streamlit reruns and its keep-alive connections are reused.
+    """
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0))
+    return session
+
+
+@st.cache_resource
+def get_backend_launcher():
+    """
+    The backend process spawned by this Streamlit server, shared by all
+    sessions so a session doesn't start a second server while the first one
+    is still booting. The lock keeps two sessions from spawning at once.
+    """
+    return {"process": None, "lock": threading.Lock()}
+
+
+def backend_process_alive(launcher):
+    """Check whether the backend process spawned by this server is still running"""
+    process = launcher["process"]
+    # poll() also reaps a backend that has exited, so it isn't left as a zombie
+    return process is not None and process.poll() is None
+
 
 # Function to start FastAPI backend
 def start_fastapi_backend():
-    """Start the FastAPI backend server in a separate process"""
+    """Start the FastAPI backend server in a separate process, unless it's already running"""
     try:
-        # Get the directory of the current script
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        main_py_path = os.path.join(current_dir, "main.py")
-        
-        # Start the FastAPI server
-        subprocess.Popen([sys.executable, main_py_path], 
-                        cwd=current_dir,
-                        stdout=subprocess.DEVNULL, 
-                        stderr=subprocess.DEVNULL)
-        
-        # Wait a bit for the server to start
-        time.sleep(2)
-        
-        # Test if server is running
-        for i in range(10):  # Try for 10 seconds
+        launcher = get_backend_launcher()
+        with launcher["lock"]:
+            if not backend_process_alive(launcher):
+                # Get the directory of the current script
+                current_dir = os.path.dirname(os.path.abspath(__file__))
+                main_py_path = os.path.join(current_dir, "main.py")
+
+                # Start the FastAPI server
+                launcher["process"] = subprocess.Popen([sys.executable, main_py_path],
+                                                       cwd=current_dir,
+                                                       stdout=subprocess.DEVNULL,
+                                                       stderr=subprocess.DEVNULL)
+
+        # Poll the health endpoint with a short, growing delay so we return as
+        # soon as the server is up (give up after 10 seconds)
+        session = get_http_session()
+        deadline = time.monotonic() + 10
+        delay = 0.05
+        while time.monotonic() < deadline:
             try:
-                response = requests.get(f"{API_BASE_URL}/health", timeout=1)
+                response = session.get(f"{API_BASE_URL}/health", timeout=0.3)
                 if response.status_code == 200:
                     return True
-            except:
-                time.sleep(1)
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(delay)
+            delay = min(delay * 1.7, 0.5)
         return False
     except Exception as e:
         st.error(f"Failed to start backend server: {e}")
@@ -56,7 +104,7 @@ if "backend_started" not in st.session_state:
 if not st.session_state.backend_started:
     try:
         # First check if backend is already running
-        response = requests.get(f"{API_BASE_URL}/health", timeout=2)
+        response = get_http_session().get(f"{API_BASE_URL}/health", timeout=2)
         if response.status_code == 200:
             st.session_state.backend_started = True
     except:
@@ -73,7 +121,7 @@ if not st.session_state.backend_started:
 
 # Initialize session state
 if "conversation_history" not in st.session_state:
-    st.session_state.conversation_history = []
+    st.session_state.conversation_history = deque()
 if "user_info" not in st.session_state:
     st.session_state.user_info = {
         "first_name": None,
@@ -93,7 +141,7 @@ if "selected_language" not in st.session_state:
 
 def reset_conversation():
     """Reset conversation and user info to start fresh"""
-    st.session_state.conversation_history = []
+    st.session_state.conversation_history = deque()
     st.session_state.user_info = {
         "first_name": None,
         "last_name": None,
@@ -107,18 +155,33 @@ def reset_conversation():
     st.session_state.current_phase = "collection"
 
 
+def build_chat_payload(message: str) -> bytes:
+    """Build the JSON body for the chat endpoints"""
+    history = st.session_state.conversation_history
+    payload = {
+        "message": message,
+        "user_info": st.session_state.user_info,
+        "conversation_history": [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in islice(history, max(0, len(history) - HISTORY_WINDOW), None)
+        ],
+        "phase": st.session_state.current_phase,
+        "language": st.session_state.selected_language
+    }
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
 def call_chat_api(message: str) -> Dict:
     """Call the FastAPI chat endpoint"""
     try:
-        payload = {
-            "message": message,
-            "user_info": st.session_state.user_info,
-            "conversation_history": st.session_state.conversation_history,
-            "phase": st.session_state.current_phase,
-            "language": st.session_state.selected_language
-        }
-
-        response = requests.post(f"{API_BASE_URL}/chat", json=payload, timeout=30)
+        response = get_http_session().post(
+            f"{API_BASE_URL}/chat",
+            data=build_chat_payload(message),
+            headers={"Content-Type": "application/json"},
+            timeout=30
+        )
 
         if response.status_code == 200:
             return response.json()
@@ -133,26 +196,67 @@ def call_chat_api(message: str) -> Dict:
         return None
 
 
+def stream_chat_api(message: str):
+    """
+    Call the streaming chat endpoint and yield the answer as it arrives.
+    User info and phase are updated from the first line of the stream.
+    """
+    try:
+        with get_http_session().post(
+            f"{API_BASE_URL}/chat/stream",
+            data=build_chat_payload(message),
+            headers={"Content-Type": "application/json"},
+            stream=True,
+            timeout=(5, 60)
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"API Error: {response.status_code} - {response.text}")
+                return
+
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = orjson.loads(line) if orjson is not None else json.loads(line)
+                if event["type"] == "meta":
+                    st.session_state.user_info = event["updated_user_info"]
+                    st.session_state.current_phase = event["phase"]
+                elif event["type"] == "delta":
+                    yield event["content"]
+                elif event["type"] == "error":
+                    st.error(f"API Error: {event['detail']}")
+                    return
+    except requests.exceptions.ConnectionError:
+        st.error("Backend server connection failed. Please refresh the page.")
+    except Exception as e:
+        st.error(f"Connection error: {e}")
+
+
 def add_message_to_history(role: str, content: str):
     """Add a message to conversation history"""
     st.session_state.conversation_history.append({
         "role": role,
         "content": content,
-        "timestamp": datetime.now().isoformat()
+        "ts": time.time_ns()  # Local ordering only, not sent to the backend
     })
 
 
 def display_chat_history():
     """Display the conversation history"""
     for msg in st.session_state.conversation_history:
-        if msg["role"] == "user":
-            with st.chat_message("user"):
-                st.write(msg["content"])
-        elif msg["role"] == "assistant":
-            with st.chat_message("assistant"):
+        if msg["role"] in ("user", "assistant"):
+            with st.chat_message(msg["role"]):
                 st.write(msg["content"])
 
 
+def show_phase_indicator(placeholder):
+    """Show the current phase in the given placeholder"""
+    phase_text = "איסוף מידע" if st.session_state.current_phase == "collection" else "שאלות ותשובות"
+    if st.session_state.selected_language == "english":
+        phase_text = "Information Collection" if st.session_state.current_phase == "collection" else "Q&A"
+
+    placeholder.info(f"Current Phase / שלב נוכחי: {phase_text}")
+
+
 def main():
     # Header
     st.title("🏥 Medical HMO Chatbot")
@@ -179,12 +283,26 @@ def main():
     # Sidebar with user info
     # display_user_info_sidebar()  # Removed sidebar
 
-    # Phase indicator
-    phase_text = "איסוף מידע" if st.session_state.current_phase == "collection" else "שאלות ותשובות"
-    if st.session_state.selected_language == "english":
-        phase_text = "Information Collection" if st.session_state.current_phase == "collection" else "Q&A"
+    chat_area()
 
-    st.info(f"Current Phase / שלב נוכחי: {phase_text}")
+    # Footer
+    st.divider()
+    if st.session_state.selected_language == "hebrew":
+        st.caption("מערכת ייעוץ רפואי לקופות החולים בישראל - מכבי, מאוחדת, כללית")
+    else:
+        st.caption("Medical consultation system for Israeli health funds - Maccabi, Meuhedet, Clalit")
+
+
+@fragment
+def chat_area():
+    """
+    Phase indicator, chat history and input. Sending a message only reruns
+    this fragment, not the whole page.
+    """
+    # Phase indicator (a placeholder, so it can be refreshed after a response
+    # without rerunning the whole script)
+    phase_placeholder = st.empty()
+    show_phase_indicator(phase_placeholder)
 
     # Chat interface
     st.header("💬 Chat")
@@ -199,20 +317,26 @@ def main():
         else:
             welcome_msg = "Hello! I'm here to help you with questions about your health fund services. Let's get started!"
 
-        with st.chat_message("assistant"):
-            st.write(welcome_msg)
+        welcome_placeholder = st.empty()
+        with welcome_placeholder.container():
+            with st.chat_message("assistant"):
+                st.write(welcome_msg)
 
         # Automatically start the collection process
-        if not st.session_state.conversation_history:
-            with st.spinner("Starting information collection / מתחיל באיסוף מידע..."):
-                start_msg = "בואו נתחיל באיסוף המידע" if st.session_state.selected_language == "hebrew" else "Let's start collecting the information"
-                response = call_chat_api(start_msg)
+        with st.spinner("Starting information collection / מתחיל באיסוף מידע..."):
+            start_msg = "בואו נתחיל באיסוף המידע" if st.session_state.selected_language == "hebrew" else "Let's start collecting the information"
+            response = call_chat_api(start_msg)
+
+        if response:
+            add_message_to_history("assistant", response["response"])
+            st.session_state.user_info = response["updated_user_info"]
+            st.session_state.current_phase = response["phase"]
 
-                if response:
-                    add_message_to_history("assistant", response["response"])
-                    st.session_state.user_info = response["updated_user_info"]
-                    st.session_state.current_phase = response["phase"]
-                    st.rerun()
+            # Replace the welcome message with the first question in place
+            with welcome_placeholder.container():
+                with st.chat_message("assistant"):
+                    st.write(response["response"])
+            show_phase_indicator(phase_placeholder)
 
     # Chat input
     if prompt := st.chat_input("Type your message here / הקלד את הודעתך כאן"):
@@ -223,39 +347,23 @@ def main():
         with st.chat_message("user"):
             st.write(prompt)
 
-        # Call API
-        with st.spinner("Processing / מעבד..."):
-            response = call_chat_api(prompt)
+        # Call API and display the assistant response as it streams in
+        # (user info and phase are updated by the stream)
+        with st.chat_message("assistant"):
+            assistant_response = st.write_stream(stream_chat_api(prompt))
 
-        if response:
+        if assistant_response:
             # Add assistant response to history
-            add_message_to_history("assistant", response["response"])
-
-            # Update user info if changed
-            st.session_state.user_info = response["updated_user_info"]
-
-            # Update phase if changed
-            st.session_state.current_phase = response["phase"]
-
-            # Display assistant response
-            with st.chat_message("assistant"):
-                st.write(response["response"])
+            add_message_to_history("assistant", assistant_response)
 
-            # Rerun to update sidebar
-            st.rerun()
+            # The response is already on screen, only the phase may have changed
+            show_phase_indicator(phase_placeholder)
 
     # Clear conversation button
     if st.button("🔄 Start New Conversation / התחל שיחה חדשה"):
         reset_conversation()
         st.rerun()
 
-    # Footer
-    st.divider()
-    if st.session_state.selected_language == "hebrew":
-        st.caption("מערכת ייעוץ רפואי לקופות החולים בישראל - מכבי, מאוחדת, כללית")
-    else:
-        st.caption("Medical consultation system for Israeli health funds - Maccabi, Meuhedet, Clalit")
-
 import subprocess
 
 
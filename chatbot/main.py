@@ -1,12 +1,18 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, validator
 from typing import List, Dict, Optional, Literal
 import logging
 import os
+import pickle
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
 import json
-from openai import AzureOpenAI
+from openai import AzureOpenAI, DefaultHttpxClient
+import httpx
 from dotenv import load_dotenv
 import re
 
@@ -21,6 +27,29 @@ except ImportError as e:
     print(f"Import error: {e}")
     raise ImportError("BeautifulSoup4 is required but not installed")
 
+# Prefer the C-based lxml parser, which is several times faster than Python's
+# html.parser; fall back to html.parser if lxml isn't installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# google-re2 matches the keyword alternations in linear time and releases the
+# GIL while matching; they only use plain literals, alternation and named
+# groups, so it's a drop-in for them. Without it the re module is used
+try:
+    import re2 as keyword_re
+except ImportError:
+    keyword_re = re
+
+# pyahocorasick finds all service keywords in one pass over the message;
+# without it the per-service regexes are used
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -47,6 +76,32 @@ app.add_middleware(
 # Knowledge base storage
 knowledge_base = {}
 
+# The parsed knowledge base is pickled next to the HTML files and reused while
+# it is newer than all of them. Bump the version when the parsing changes.
+KB_CACHE_FILENAME = "knowledge_base.pkl"
+KB_CACHE_VERSION = 4
+
+
+def load_cached_knowledge_base(cache_path, source_paths):
+    """Load the pickled knowledge base, or None if it is missing, stale or from another version"""
+    try:
+        if os.path.getmtime(cache_path) < max(os.path.getmtime(path) for path in source_paths):
+            return None
+        with open(cache_path, 'rb') as file:
+            version, cached_knowledge_base = pickle.load(file)
+    except Exception:
+        return None
+    return cached_knowledge_base if version == KB_CACHE_VERSION else None
+
+
+def save_cached_knowledge_base(cache_path):
+    """Pickle the parsed knowledge base for the next startup"""
+    try:
+        with open(cache_path, 'wb') as file:
+            pickle.dump((KB_CACHE_VERSION, knowledge_base), file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logger.warning("⚠️ Could not cache knowledge base: %s", e)
+
 
 def load_knowledge_base():
     """Load all HTML files into memory as knowledge base"""
@@ -55,15 +110,13 @@ def load_knowledge_base():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_directory = os.path.join(os.path.dirname(current_dir), "phase2_data")
 
-    print(f"📂 Loading knowledge base from: {data_directory}")
-    print(f"📁 Directory exists: {os.path.exists(data_directory)}")
+    logger.info("📂 Loading knowledge base from: %s", data_directory)
 
-    if os.path.exists(data_directory):
-        files_in_dir = os.listdir(data_directory)
-        print(f"📄 Files in directory: {files_in_dir}")
-    else:
-        print(f"❌ ERROR: Directory does not exist!")
+    if not os.path.exists(data_directory):
+        logger.error("❌ ERROR: Directory does not exist!")
         return
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📄 Files in directory: %s", os.listdir(data_directory))
 
     service_files = {
         'dental': 'dentel_services.html',
@@ -74,59 +127,74 @@ def load_knowledge_base():
         'workshops': 'workshops_services.html'
     }
 
-    for service_type, filename in service_files.items():
-        file_path = os.path.join(data_directory, filename)
-        print(f"🔍 Trying to load: {file_path}")
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
+    cache_path = os.path.join(data_directory, KB_CACHE_FILENAME)
+    source_paths = [os.path.join(data_directory, filename) for filename in service_files.values()]
+    cached_knowledge_base = load_cached_knowledge_base(cache_path, source_paths)
+    if cached_knowledge_base is not None:
+        logger.info("⚡ Loaded parsed knowledge base from cache: %s", cache_path)
+        knowledge_base.update(cached_knowledge_base)
+    else:
+        for service_type, filename in service_files.items():
+            file_path = os.path.join(data_directory, filename)
+            logger.debug("🔍 Trying to load: %s", file_path)
+            try:
+                # Read the whole file in one call and close it before parsing
+                content = Path(file_path).read_text(encoding='utf-8')
+                # Parse once and share the tree. The structured data is read first
+                # because cleaning removes script and style tags from the tree.
+                soup = parse_html(content)
+                structured_data = extract_structured_data(soup)
+                # Only the size and start of the raw HTML are kept, for the debug endpoints
                 knowledge_base[service_type] = {
-                    'raw_html': content,
-                    'clean_text': clean_html_content(content),
-                    'structured_data': extract_structured_data(content)
+                    'raw_html_length': len(content),
+                    'raw_html_preview': content[:100],
+                    'clean_text': clean_html_content(soup),
+                    'structured_data': structured_data,
+                    'context_fragments': build_context_fragments(structured_data)
                 }
-            print(f"✅ Loaded {service_type} - {len(content)} chars")
-            print(f"   Title: {knowledge_base[service_type]['structured_data']['title']}")
-        except Exception as e:
-            print(f"❌ Failed to load {filename}: {e}")
+                logger.debug("✅ Loaded %s - %s chars, title: %s", service_type, len(content),
+                             knowledge_base[service_type]['structured_data']['title'])
+            except Exception as e:
+                logger.error("❌ Failed to load %s: %s", filename, e)
 
-    print(f"🏁 Knowledge base loaded with {len(knowledge_base)} services: {list(knowledge_base.keys())}")
+        # Only cache a complete knowledge base, so failed files are retried next time
+        if len(knowledge_base) == len(service_files):
+            save_cached_knowledge_base(cache_path)
+
+    logger.info("🏁 Knowledge base loaded with %s services: %s", len(knowledge_base), list(knowledge_base))
+
+    # Drop contexts rendered from a previous load, and prebuild the full context
+    # (all services, HMOs and tiers) used by every comparison question
+    render_knowledge_context.cache_clear()
+    render_knowledge_context(tuple(knowledge_base), HMO_ORDER, TIER_ORDER)
 
     # Test pregnancy specifically
     if 'pregnancy' in knowledge_base:
-        pregnancy_data = knowledge_base['pregnancy']['structured_data']
-        print(f"🤰 Pregnancy data loaded:")
-        print(f"   Title: {pregnancy_data['title']}")
-        print(f"   Services: {len(pregnancy_data['services'])}")
-        if pregnancy_data['services']:
-            print(f"   First service: {pregnancy_data['services'][0]['service_name']}")
+        if logger.isEnabledFor(logging.DEBUG):
+            pregnancy_data = knowledge_base['pregnancy']['structured_data']
+            logger.debug("🤰 Pregnancy data loaded: title %s, %s services", pregnancy_data['title'],
+                         len(pregnancy_data['services']))
     else:
-        print(f"❌ Pregnancy data NOT loaded!")
+        logger.warning("❌ Pregnancy data NOT loaded!")
+
 
+def parse_html(html_content):
+    """Parse an HTML document into a BeautifulSoup tree"""
+    return BeautifulSoup(html_content, HTML_PARSER)
 
-def clean_html_content(html_content):
-    """Clean HTML content and extract structured text"""
-    soup = BeautifulSoup(html_content, 'html.parser')
 
+def clean_html_content(soup):
+    """Clean parsed HTML content and extract structured text (removes script and style tags from the tree)"""
     # Remove any script or style elements
     for script in soup(["script", "style"]):
         script.decompose()
 
-    # Get text content
-    text = soup.get_text()
+    # Get text content and collapse all whitespace runs to single spaces
+    return ' '.join(soup.get_text().split())
 
-    # Clean up whitespace
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = ' '.join(chunk for chunk in chunks if chunk)
-
-    return text
-
-
-def extract_structured_data(html_content):
-    """Extract structured data from HTML for better processing"""
-    soup = BeautifulSoup(html_content, 'html.parser')
 
+def extract_structured_data(soup):
+    """Extract structured data from parsed HTML for better processing"""
     structured_data = {
         'title': '',
         'description': '',
@@ -176,83 +244,140 @@ def extract_structured_data(html_content):
     return structured_data
 
 
+# A tier label at the start of a line of a benefits cell
+TIER_LABEL_RE = re.compile(r'^[^\S\n]*(זהב|כסף|ארד):', re.MULTILINE)
+
+
 def parse_tier_benefits(benefits_text):
     """Parse tier benefits from text"""
     tiers = {}
-    lines = benefits_text.split('\n')
-    current_tier = None
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith('זהב:'):
-            current_tier = 'זהב'
-            tiers[current_tier] = line.replace('זהב:', '').strip()
-        elif line.startswith('כסף:'):
-            current_tier = 'כסף'
-            tiers[current_tier] = line.replace('כסף:', '').strip()
-        elif line.startswith('ארד:'):
-            current_tier = 'ארד'
-            tiers[current_tier] = line.replace('ארד:', '').strip()
-        elif current_tier and line:
-            # Continue previous tier description
-            tiers[current_tier] += ' ' + line
+    matches = list(TIER_LABEL_RE.finditer(benefits_text))
+
+    # Each tier runs from its label to the next label; the text on the label
+    # line comes first and the following non-empty lines are joined to it
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        tier = match.group(1)
+        end = next_match.start() if next_match else len(benefits_text)
+        first_line, *more_lines = benefits_text[match.start():end].split('\n')
+        parts = [first_line.strip().replace(tier + ':', '').strip()]
+        parts.extend(line for line in map(str.strip, more_lines) if line)
+        tiers[tier] = ' '.join(parts)
 
     return tiers
 
-def detect_hypothetical_query(user_message: str) -> Dict[str, Optional[str]]:
-    """Detect if user is asking about different HMOs or tiers than their own"""
-    message_lower = user_message.lower()
+def keyword_pattern(keywords):
+    """
+    Compile keywords into one alternation regex, so a message is scanned once
+    instead of once per keyword. Longer keywords come first so findall
+    returns the whole keyword when one contains another.
+    """
+    return keyword_re.compile('|'.join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True)))
+
 
-    # HMO detection - ENHANCED with English support
-    detected_hmos = []
+def build_context_fragments(structured_data):
+    """
+    Format the context lines of a service once at load time, so building the
+    LLM context for a request only picks the lines for the target HMOs and tiers.
 
-    # Hebrew HMO detection
-    if any(word in message_lower for word in ['מכבי', 'maccabi']):
-        detected_hmos.append('מכבי')
-    if any(word in message_lower for word in ['מאוחדת', 'meuhedet']):
-        detected_hmos.append('מאוחדת')
-    if any(word in message_lower for word in ['כללית', 'clalit']):
-        detected_hmos.append('כללית')
+    Returns:
+        Dict with the 'header' lines, the 'rows' as (service name line,
+        {hmo: (hmo line, {tier: benefit line})}) and the 'contact' line per HMO
+    """
+    rows = []
+    for service_info in structured_data['services']:
+        hmo_lines = {}
+        for hmo, hmo_key in HMO_KEY.items():
+            tier_lines = {tier: f"  • {tier}: {benefit_text}" for tier, benefit_text in service_info[hmo_key].items()}
+            hmo_lines[hmo] = (f"\n{hmo}:", tier_lines)
+        rows.append((f"\n** {service_info['service_name']} **", hmo_lines))
+
+    contact_info = structured_data['contact_info']
+    return {
+        'header': [f"\n\n=== {structured_data['title']} ===", f"תיאור: {structured_data['description']}"],
+        'rows': rows,
+        'contact': {hmo: f"• {contact_info[hmo_key]}" for hmo, hmo_key in HMO_KEY.items() if hmo_key in contact_info},
+    }
+
+
+# HMO and tier keywords (Hebrew and English), mapped to the Hebrew name
+HMO_KEYWORDS = {
+    'מכבי': 'מכבי', 'maccabi': 'מכבי',
+    'מאוחדת': 'מאוחדת', 'meuhedet': 'מאוחדת',
+    'כללית': 'כללית', 'clalit': 'כללית',
+}
+TIER_KEYWORDS = {
+    'זהב': 'זהב', 'gold': 'זהב',
+    'כסף': 'כסף', 'silver': 'כסף',
+    'ארד': 'ארד', 'bronze': 'ארד',
+}
+# Keys of each HMO in the structured service data
+HMO_KEY = {'מכבי': 'maccabi', 'מאוחדת': 'meuhedet', 'כללית': 'clalit'}
+# Detection order of the names, independent of where they appear in the message
+HMO_ORDER = ('מכבי', 'מאוחדת', 'כללית')
+TIER_ORDER = ('זהב', 'כסף', 'ארד')
+
+# **ENHANCED: Better comparison and hypothetical indicators - BILINGUAL**
+COMPARISON_PHRASES = [
+    # Hebrew phrases
+    'השווה', 'השוואה', 'לעומת', 'נגד', 'מול', 'בהשוואה ל',
+    'מה ההבדל', 'איך שונה', 'מה יותר טוב', 'איזה עדיף',
+    'מה לגבי', 'ואם הייתי', 'אם הייתי ב', 'לו הייתי',
+    'במקום', 'אילו הייתי', 'אם אני עוברת ל', 'אם אעבור ל',
+    # English phrases
+    'compare', 'comparison', 'versus', 'vs', 'against', 'compared to',
+    'what is the difference', 'how different', 'what is better', 'which is better',
+    'what about', 'what if i', 'if i was', 'if i were', 'suppose i',
+    'instead of', 'if i had', 'if i switch to', 'if i move to',
+    'rather than', 'as opposed to', 'in contrast to'
+]
+
+# **NEW: Detect if this is a follow-up hypothetical question - BILINGUAL**
+FOLLOWUP_HYPOTHETICAL_PHRASES = [
+    # Hebrew
+    'מה לגבי', 'ואם', 'אם הייתי', 'לו הייתי', 'במקום', 'אילו',
+    # English
+    'what about', 'what if', 'if i was', 'if i were', 'suppose', 'instead'
+]
+
+# The keyword regexes are compiled on first use rather than at import, so a
+# worker starts faster and the first request pays the (one-time) cost
+@lru_cache(maxsize=None)
+def hmo_pattern():
+    return keyword_pattern(HMO_KEYWORDS)
+
+
+@lru_cache(maxsize=None)
+def tier_pattern():
+    return keyword_pattern(TIER_KEYWORDS)
+
+
+@lru_cache(maxsize=None)
+def comparison_pattern():
+    return keyword_pattern(COMPARISON_PHRASES)
+
+
+@lru_cache(maxsize=None)
+def followup_hypothetical_pattern():
+    return keyword_pattern(FOLLOWUP_HYPOTHETICAL_PHRASES)
+
+
+def detect_hypothetical_query(message_lower: str) -> Dict[str, Optional[str]]:
+    """Detect if user is asking about different HMOs or tiers than their own (message_lower is the lowercased message)"""
+    # HMO detection - ENHANCED with English support
+    found_hmos = {HMO_KEYWORDS[word] for word in hmo_pattern().findall(message_lower)}
+    detected_hmos = [hmo for hmo in HMO_ORDER if hmo in found_hmos]
 
     # Tier detection - ENHANCED with English support
-    detected_tiers = []
-
-    # Hebrew and English tier detection
-    if any(word in message_lower for word in ['זהב', 'gold']):
-        detected_tiers.append('זהב')
-    if any(word in message_lower for word in ['כסף', 'silver']):
-        detected_tiers.append('כסף')
-    if any(word in message_lower for word in ['ארד', 'bronze']):
-        detected_tiers.append('ארד')
-
-    # **ENHANCED: Better comparison and hypothetical indicators - BILINGUAL**
-    comparison_phrases = [
-        # Hebrew phrases
-        'השווה', 'השוואה', 'לעומת', 'נגד', 'מול', 'בהשוואה ל',
-        'מה ההבדל', 'איך שונה', 'מה יותר טוב', 'איזה עדיף',
-        'מה לגבי', 'ואם הייתי', 'אם הייתי ב', 'לו הייתי',
-        'במקום', 'אילו הייתי', 'אם אני עוברת ל', 'אם אעבור ל',
-        # English phrases
-        'compare', 'comparison', 'versus', 'vs', 'against', 'compared to',
-        'what is the difference', 'how different', 'what is better', 'which is better',
-        'what about', 'what if i', 'if i was', 'if i were', 'suppose i',
-        'instead of', 'if i had', 'if i switch to', 'if i move to',
-        'rather than', 'as opposed to', 'in contrast to'
-    ]
+    found_tiers = {TIER_KEYWORDS[word] for word in tier_pattern().findall(message_lower)}
+    detected_tiers = [tier for tier in TIER_ORDER if tier in found_tiers]
 
-    is_comparison = any(phrase in message_lower for phrase in comparison_phrases)
+    is_comparison = comparison_pattern().search(message_lower) is not None
 
     # Multiple HMO/tier indicators - now based on actual detection
     multiple_hmos = len(detected_hmos) > 1
     multiple_tiers = len(detected_tiers) > 1
 
-    # **NEW: Detect if this is a follow-up hypothetical question - BILINGUAL**
-    is_followup_hypothetical = any(phrase in message_lower for phrase in [
-        # Hebrew
-        'מה לגבי', 'ואם', 'אם הייתי', 'לו הייתי', 'במקום', 'אילו',
-        # English
-        'what about', 'what if', 'if i was', 'if i were', 'suppose', 'instead'
-    ])
+    is_followup_hypothetical = followup_hypothetical_pattern().search(message_lower) is not None
 
     return {
         'hmo': detected_hmos[0] if len(detected_hmos) == 1 else None,
@@ -265,11 +390,11 @@ def detect_hypothetical_query(user_message: str) -> Dict[str, Optional[str]]:
         'is_followup_hypothetical': is_followup_hypothetical
     }
 
-def get_comprehensive_knowledge_context(user_message: str, user_info, hypothetical_context: Dict) -> str:
-    """Get comprehensive knowledge base context for detailed answers"""
-    logger.info(f"🔍 Starting get_comprehensive_knowledge_context")
-    logger.info(f"👤 User info: HMO={user_info.hmo_name}, Tier={user_info.insurance_tier}")
-    logger.info(f"🤔 Hypothetical context: {hypothetical_context}")
+def get_comprehensive_knowledge_context(message_lower: str, user_info, hypothetical_context: Dict) -> str:
+    """Get comprehensive knowledge base context for detailed answers (message_lower is the lowercased message)"""
+    logger.debug("🔍 Starting get_comprehensive_knowledge_context")
+    logger.debug("👤 User info: HMO=%s, Tier=%s", user_info.hmo_name, user_info.insurance_tier)
+    logger.debug("🤔 Hypothetical context: %s", hypothetical_context)
 
     # **FIXED: Check if hypothetical context exists - if so, grab ALL knowledge base**
     should_load_all_services = (
@@ -284,129 +409,144 @@ def get_comprehensive_knowledge_context(user_message: str, user_info, hypothetic
     )
 
     if should_load_all_services:
-        logger.info("🌐 Hypothetical/general context detected - loading ALL knowledge base")
+        logger.debug("🌐 Hypothetical/general context detected - loading ALL knowledge base")
         relevant_services = list(knowledge_base.keys())  # Get ALL services
-        logger.info(f"📋 Using ALL services: {relevant_services}")
+        logger.debug("📋 Using ALL services: %s", relevant_services)
     else:
         # Original behavior - identify specific relevant services
-        relevant_services = identify_relevant_services(user_message)
-        logger.info(f"📋 Identified relevant services: {relevant_services}")
+        relevant_services = identify_relevant_services(message_lower)
+        logger.debug("📋 Identified relevant services: %s", relevant_services)
 
         # **FALLBACK: If no services found but knowledge base exists, load all**
         if not relevant_services and knowledge_base:
-            logger.info("⚠️ No relevant services found - loading ALL as fallback")
+            logger.debug("⚠️ No relevant services found - loading ALL as fallback")
             relevant_services = list(knowledge_base.keys())
 
     # **DEBUG: Add more logging**
-    logger.info(f"🎯 Final relevant services: {relevant_services}")
-    logger.info(f"📚 Available services in knowledge base: {list(knowledge_base.keys())}")
+    logger.debug("🎯 Final relevant services: %s", relevant_services)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📚 Available services in knowledge base: {list(knowledge_base.keys())}")
+
+    if not relevant_services:
+        return ""
+
+    # **ENHANCED: Better logic for determining which HMOs and tiers to include**
+    target_hmos = []
+    target_tiers = []
+
+    # Priority 1: Explicit hypothetical query (e.g., "מה לגבי אם הייתי במכבי?")
+    if hypothetical_context.get('is_followup_hypothetical') and hypothetical_context['hmo']:
+        target_hmos = [hypothetical_context['hmo']]
+        logger.debug("🎯 Follow-up hypothetical detected - using: %s", hypothetical_context['hmo'])
+    # Priority 2: Specific HMO mentioned in query like "פרטים לגבי מאוחדת"
+    elif hypothetical_context.get('hmo'):
+        target_hmos = [hypothetical_context['hmo']]
+        logger.debug("🎯 Including specific HMO: %s", hypothetical_context['hmo'])
+    # Priority 3: Comparison queries
+    elif hypothetical_context['is_comparison'] or hypothetical_context['multiple_hmos']:
+        target_hmos = ['מכבי', 'מאוחדת', 'כללית']
+        logger.debug("🔄 Including all HMOs for comparison")
+    # Priority 4: User's HMO
+    else:
+        if user_info.hmo_name:
+            target_hmos = [user_info.hmo_name]
+            logger.debug("👤 Including user's HMO: %s", user_info.hmo_name)
+        else:
+            target_hmos = ['מכבי', 'מאוחדת', 'כללית']
+            logger.debug("🔄 No user HMO, including all")
+
+    # Similar logic for tiers
+    if hypothetical_context.get('is_followup_hypothetical') and hypothetical_context.get('tier'):
+        target_tiers = [hypothetical_context['tier']]
+        logger.debug("🎯 Follow-up hypothetical tier detected - using: %s", hypothetical_context['tier'])
+    elif hypothetical_context.get('tier'):
+        target_tiers = [hypothetical_context['tier']]
+        logger.debug("🎯 Including specific tier: %s", hypothetical_context['tier'])
+    elif hypothetical_context['is_comparison'] or hypothetical_context['multiple_tiers']:
+        target_tiers = ['זהב', 'כסף', 'ארד']
+        logger.debug("🔄 Including all tiers for comparison")
+    else:
+        if user_info.insurance_tier:
+            target_tiers = [user_info.insurance_tier]
+            logger.debug("👤 Including user's tier: %s", user_info.insurance_tier)
+        else:
+            target_tiers = ['זהב', 'כסף', 'ארד']
+            logger.debug("🔄 No user tier, including all")
+
+    logger.debug("📊 Final targets - HMOs: %s, Tiers: %s", target_hmos, target_tiers)
 
+    result = render_knowledge_context(tuple(relevant_services), tuple(target_hmos), tuple(target_tiers))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"📝 Final comprehensive context length: {len(result)} chars")
+        logger.debug(f"📄 First 300 chars of context:")
+        logger.debug(result[:300])
+        logger.debug("=" * 50)
+
+    return result
+
+
+@lru_cache(maxsize=256)
+def render_knowledge_context(relevant_services, target_hmos, target_tiers):
+    """
+    Join the preformatted context lines of the relevant services for the target
+    HMOs and tiers. The knowledge base doesn't change after loading, so the
+    result is cached per combination (the cache is cleared when it reloads).
+    """
     context_parts = []
 
     # Add comprehensive context for each relevant service
     for service in relevant_services:
-        logger.info(f"🔄 Processing service: {service}")
+        logger.debug("🔄 Processing service: %s", service)
         if service in knowledge_base:
             service_data = knowledge_base[service]
-            logger.info(f"✅ Found {service} in knowledge base")
+            logger.debug("✅ Found %s in knowledge base", service)
 
             # Add service title and description
-            title = service_data['structured_data']['title']
-            description = service_data['structured_data']['description']
-
-            context_parts.append(f"\n\n=== {title} ===")
-            context_parts.append(f"תיאור: {description}")
-
-            # **ENHANCED: Better logic for determining which HMOs and tiers to include**
-            target_hmos = []
-            target_tiers = []
-
-            # Priority 1: Explicit hypothetical query (e.g., "מה לגבי אם הייתי במכבי?")
-            if hypothetical_context.get('is_followup_hypothetical') and hypothetical_context['hmo']:
-                target_hmos = [hypothetical_context['hmo']]
-                logger.info(f"🎯 Follow-up hypothetical detected - using: {hypothetical_context['hmo']}")
-            # Priority 2: Specific HMO mentioned in query like "פרטים לגבי מאוחדת"
-            elif hypothetical_context.get('hmo'):
-                target_hmos = [hypothetical_context['hmo']]
-                logger.info(f"🎯 Including specific HMO: {hypothetical_context['hmo']}")
-            # Priority 3: Comparison queries
-            elif hypothetical_context['is_comparison'] or hypothetical_context['multiple_hmos']:
-                target_hmos = ['מכבי', 'מאוחדת', 'כללית']
-                logger.info("🔄 Including all HMOs for comparison")
-            # Priority 4: User's HMO
-            else:
-                if user_info.hmo_name:
-                    target_hmos = [user_info.hmo_name]
-                    logger.info(f"👤 Including user's HMO: {user_info.hmo_name}")
-                else:
-                    target_hmos = ['מכבי', 'מאוחדת', 'כללית']
-                    logger.info("🔄 No user HMO, including all")
-
-            # Similar logic for tiers
-            if hypothetical_context.get('is_followup_hypothetical') and hypothetical_context.get('tier'):
-                target_tiers = [hypothetical_context['tier']]
-                logger.info(f"🎯 Follow-up hypothetical tier detected - using: {hypothetical_context['tier']}")
-            elif hypothetical_context.get('tier'):
-                target_tiers = [hypothetical_context['tier']]
-                logger.info(f"🎯 Including specific tier: {hypothetical_context['tier']}")
-            elif hypothetical_context['is_comparison'] or hypothetical_context['multiple_tiers']:
-                target_tiers = ['זהב', 'כסף', 'ארד']
-                logger.info("🔄 Including all tiers for comparison")
-            else:
-                if user_info.insurance_tier:
-                    target_tiers = [user_info.insurance_tier]
-                    logger.info(f"👤 Including user's tier: {user_info.insurance_tier}")
-                else:
-                    target_tiers = ['זהב', 'כסף', 'ארד']
-                    logger.info("🔄 No user tier, including all")
-
-            logger.info(f"📊 Final targets - HMOs: {target_hmos}, Tiers: {target_tiers}")
+            fragments = service_data['context_fragments']
+            context_parts.extend(fragments['header'])
 
             # Add detailed service information
-            services_data = service_data['structured_data']['services']
-            logger.info(f"📋 Processing {len(services_data)} services")
+            logger.debug("📋 Processing %s services", len(fragments['rows']))
 
-            for service_info in services_data:
-                service_name = service_info['service_name']
-                context_parts.append(f"\n** {service_name} **")
+            for service_line, hmo_lines in fragments['rows']:
+                context_parts.append(service_line)
 
                 for hmo in target_hmos:
-                    hmo_key = {'מכבי': 'maccabi', 'מאוחדת': 'meuhedet', 'כללית': 'clalit'}[hmo]
-                    hmo_benefits = service_info[hmo_key]
-
-                    context_parts.append(f"\n{hmo}:")
-                    for tier in target_tiers:
-                        if tier in hmo_benefits:
-                            benefit_text = hmo_benefits[tier]
-                            context_parts.append(f"  • {tier}: {benefit_text}")
+                    hmo_line, tier_lines = hmo_lines[hmo]
+                    context_parts.append(hmo_line)
+                    context_parts.extend([tier_lines[tier] for tier in target_tiers if tier in tier_lines])
 
             # Add contact information
-            contact_info = service_data['structured_data']['contact_info']
-            if contact_info:
+            if service_data['structured_data']['contact_info']:
                 context_parts.append(f"\n** מידע ליצירת קשר **")
 
-                for hmo in target_hmos:
-                    hmo_key = {'מכבי': 'maccabi', 'מאוחדת': 'meuhedet', 'כללית': 'clalit'}[hmo]
-                    if hmo_key in contact_info:
-                        contact_text = contact_info[hmo_key]
-                        context_parts.append(f"• {contact_text}")
+                contact_lines = fragments['contact']
+                context_parts.extend([contact_lines[hmo] for hmo in target_hmos if hmo in contact_lines])
         else:
-            logger.info(f"❌ Service {service} not found in knowledge base")
+            logger.debug("❌ Service %s not found in knowledge base", service)
 
-    result = '\n'.join(context_parts)
-    logger.info(f"📝 Final comprehensive context length: {len(result)} chars")
-    logger.info(f"📄 First 300 chars of context:")
-    logger.info(result[:300])
-    logger.info("=" * 50)
+    return '\n'.join(context_parts)
+
+# Services inferred from the assistant's recent messages, in priority order
+CONTEXT_SERVICE_ORDER = ('pregnancy', 'dental', 'optometry')
+
+
+@lru_cache(maxsize=None)
+def context_service_pattern():
+    """One regex naming the service of each mention (English terms match in any case)"""
+    return keyword_re.compile(
+        r'(?P<pregnancy>הריון|(?i:pregnancy))'
+        r'|(?P<dental>שיניים|(?i:dental))'
+        r'|(?P<optometry>ראייה|עיניים|(?i:optometry))'
+    )
 
-    return result
 
 # **NEW: Enhanced service detection that can work with conversation context**
-def identify_relevant_services_with_context(user_message: str, conversation_history: List = None) -> List[str]:
-    """Enhanced version that can infer services from conversation context"""
+def identify_relevant_services_with_context(message_lower: str, conversation_history: List = None) -> List[str]:
+    """Enhanced version that can infer services from conversation context (message_lower is the lowercased message)"""
 
     # First try the original function
-    relevant_services = identify_relevant_services(user_message)
+    relevant_services = identify_relevant_services(message_lower)
 
     if relevant_services:
         return relevant_services
@@ -417,127 +557,168 @@ def identify_relevant_services_with_context(user_message: str, conversation_hist
         recent_messages = conversation_history[-4:]  # Last 4 messages
         for msg in reversed(recent_messages):  # Most recent first
             if msg.role == "assistant":
-                # Check if assistant mentioned specific services
-                if "הריון" in msg.content or "pregnancy" in msg.content.lower():
-                    print("🔍 Inferred pregnancy from conversation context")
-                    return ['pregnancy']
-                elif "שיניים" in msg.content or "dental" in msg.content.lower():
-                    print("🔍 Inferred dental from conversation context")
-                    return ['dental']
-                elif "ראייה" in msg.content or "עיניים" in msg.content or "optometry" in msg.content.lower():
-                    print("🔍 Inferred optometry from conversation context")
-                    return ['optometry']
+                # Check if assistant mentioned specific services (one scan per message)
+                mentioned = {match.lastgroup for match in context_service_pattern().finditer(msg.content)}
+                for service in CONTEXT_SERVICE_ORDER:
+                    if service in mentioned:
+                        print(f"🔍 Inferred {service} from conversation context")
+                        return [service]
                 # Add more service inference as needed
 
     return relevant_services
 
-def identify_relevant_services(user_message: str) -> List[str]:
-    """Identify which services are relevant to the user's query - ENHANCED with English support"""
-    message_lower = user_message.lower()
-    relevant_services = []
-
-    # Service keywords mapping - ENHANCED with comprehensive English support
-    service_keywords = {
-        'dental': [
-            # Hebrew terms
-            'שיניים', 'שן', 'סתימה', 'כתר', 'שתל', 'טיפול שורש', 'יישור', 'קוסמטי',
-            # English terms
-            'dental', 'teeth', 'tooth', 'filling', 'crown', 'implant', 'root canal',
-            'orthodontic', 'braces', 'cosmetic dental', 'dentist', 'cavity', 'extraction',
-            'cleaning', 'whitening', 'oral hygiene', 'gum', 'periodontal'
-        ],
-        'optometry': [
-            # Hebrew terms
-            'ראייה', 'משקפיים', 'עדשות', 'עיניים', 'עין', 'לחץ תוך עיני', 'לייזר',
-            # English terms
-            'optometry', 'glasses', 'contact', 'vision', 'eye', 'eyes', 'laser',
-            'eyeglasses', 'contact lenses', 'eye exam', 'prescription', 'frames',
-            'ophthalmology', 'glaucoma', 'retina', 'cataract', 'vision correction'
-        ],
-        'pregnancy': [
-            # Hebrew terms
-            'הריון', 'לידה', 'היריון', 'בהיריון', 'מיילדת', 'הרה', 'הריונית', 'מעקב הריון',
-            'סקר גנטי', 'הכנה ללידה', 'מגיע לי', 'זכויות הריון',
-            # English terms
-            'pregnancy', 'birth', 'pregnant', 'maternity', 'prenatal', 'obstetric',
-            'delivery', 'labor', 'midwife', 'ultrasound', 'genetic screening',
-            'childbirth', 'prenatal care', 'pregnancy benefits', 'maternal care',
-            'postpartum', 'antenatal', 'expecting', 'conception'
-        ],
-        'alternative': [
-            # Hebrew terms
-            'רפואה משלימה', 'אלטרנטיבית', 'דיקור', 'שיאצו', 'רפלקסולוגיה', 'נטורופתיה',
-            'הומאופתיה', 'כירופרקטיקה',
-            # English terms
-            'alternative', 'complementary medicine', 'acupuncture', 'shiatsu',
-            'reflexology', 'naturopathy', 'homeopathy', 'chiropractic', 'holistic',
-            'massage therapy', 'herbal medicine', 'traditional medicine', 'wellness'
-        ],
-        'communication_clinic': [
-            # Hebrew terms
-            'תקשורת', 'קלינקה', 'דיבור', 'שפה',
-            # English terms
-            'communication', 'clinic', 'speech', 'language', 'speech therapy',
-            'language therapy', 'communication disorders', 'speech pathology',
-            'stuttering', 'voice therapy', 'articulation'
-        ],
-        'workshops': [
-            # Hebrew terms
-            'סדנאות', 'קהילה', 'בריאות הקהילה', 'קורסים',
-            # English terms
-            'workshops', 'community', 'courses', 'classes', 'seminars',
-            'community health', 'health education', 'wellness programs',
-            'health workshops', 'group sessions', 'training'
-        ]
-    }
-
-    # Check for general questions about benefits or services - ENHANCED with English
-    general_keywords = [
+SERVICE_KEYWORDS = {
+    'dental': [
+        # Hebrew terms
+        'שיניים', 'שן', 'סתימה', 'כתר', 'שתל', 'טיפול שורש', 'יישור', 'קוסמטי',
+        # English terms
+        'dental', 'teeth', 'tooth', 'filling', 'crown', 'implant', 'root canal',
+        'orthodontic', 'braces', 'cosmetic dental', 'dentist', 'cavity', 'extraction',
+        'cleaning', 'whitening', 'oral hygiene', 'gum', 'periodontal'
+    ],
+    'optometry': [
+        # Hebrew terms
+        'ראייה', 'משקפיים', 'עדשות', 'עיניים', 'עין', 'לחץ תוך עיני', 'לייזר',
+        # English terms
+        'optometry', 'glasses', 'contact', 'vision', 'eye', 'eyes', 'laser',
+        'eyeglasses', 'contact lenses', 'eye exam', 'prescription', 'frames',
+        'ophthalmology', 'glaucoma', 'retina', 'cataract', 'vision correction'
+    ],
+    'pregnancy': [
+        # Hebrew terms
+        'הריון', 'לידה', 'היריון', 'בהיריון', 'מיילדת', 'הרה', 'הריונית', 'מעקב הריון',
+        'סקר גנטי', 'הכנה ללידה', 'מגיע לי', 'זכויות הריון',
+        # English terms
+        'pregnancy', 'birth', 'pregnant', 'maternity', 'prenatal', 'obstetric',
+        'delivery', 'labor', 'midwife', 'ultrasound', 'genetic screening',
+        'childbirth', 'prenatal care', 'pregnancy benefits', 'maternal care',
+        'postpartum', 'antenatal', 'expecting', 'conception'
+    ],
+    'alternative': [
+        # Hebrew terms
+        'רפואה משלימה', 'אלטרנטיבית', 'דיקור', 'שיאצו', 'רפלקסולוגיה', 'נטורופתיה',
+        'הומאופתיה', 'כירופרקטיקה',
+        # English terms
+        'alternative', 'complementary medicine', 'acupuncture', 'shiatsu',
+        'reflexology', 'naturopathy', 'homeopathy', 'chiropractic', 'holistic',
+        'massage therapy', 'herbal medicine', 'traditional medicine', 'wellness'
+    ],
+    'communication_clinic': [
+        # Hebrew terms
+        'תקשורת', 'קלינקה', 'דיבור', 'שפה',
+        # English terms
+        'communication', 'clinic', 'speech', 'language', 'speech therapy',
+        'language therapy', 'communication disorders', 'speech pathology',
+        'stuttering', 'voice therapy', 'articulation'
+    ],
+    'workshops': [
         # Hebrew terms
-        'הטבות', 'שירותים', 'קופת חולים', 'מסלול', 'זהב', 'כסף', 'ארד',
-        'מגיע לי', 'זכויות',
+        'סדנאות', 'קהילה', 'בריאות הקהילה', 'קורסים',
         # English terms
-        'benefits', 'services', 'hmo', 'tier', 'gold', 'silver', 'bronze',
-        'coverage', 'insurance', 'plan', 'entitled', 'rights', 'what do i get',
-        'what am i entitled to', 'health insurance', 'medical coverage'
+        'workshops', 'community', 'courses', 'classes', 'seminars',
+        'community health', 'health education', 'wellness programs',
+        'health workshops', 'group sessions', 'training'
     ]
+}
 
-    is_general_query = any(keyword in message_lower for keyword in general_keywords)
+# Check for general questions about benefits or services - ENHANCED with English
+GENERAL_KEYWORDS = [
+    # Hebrew terms
+    'הטבות', 'שירותים', 'קופת חולים', 'מסלול', 'זהב', 'כסף', 'ארד',
+    'מגיע לי', 'זכויות',
+    # English terms
+    'benefits', 'services', 'hmo', 'tier', 'gold', 'silver', 'bronze',
+    'coverage', 'insurance', 'plan', 'entitled', 'rights', 'what do i get',
+    'what am i entitled to', 'health insurance', 'medical coverage'
+]
 
+# Phrases asking about benefits in general - ENHANCED with English
+BENEFIT_PHRASES = [
+    # Hebrew
+    'מה מגיע', 'איך מגיע', 'זכויות', 'הטבות',
+    # English
+    'what do i get', 'what am i entitled', 'what are my benefits', 'what coverage',
+    'what services', 'my benefits', 'my rights', 'entitled to'
+]
+
+@lru_cache(maxsize=None)
+def service_patterns():
+    return {service: keyword_pattern(keywords) for service, keywords in SERVICE_KEYWORDS.items()}
+
+
+@lru_cache(maxsize=None)
+def general_pattern():
+    return keyword_pattern(GENERAL_KEYWORDS)
+
+
+@lru_cache(maxsize=None)
+def benefit_pattern():
+    return keyword_pattern(BENEFIT_PHRASES)
+
+
+@lru_cache(maxsize=None)
+def service_automaton():
+    """
+    Aho-Corasick automaton mapping each service keyword to the services it
+    belongs to, or None if pyahocorasick isn't installed
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for service, keywords in SERVICE_KEYWORDS.items():
+        for keyword in keywords:
+            automaton.add_word(keyword, automaton.get(keyword, ()) + (service,))
+    automaton.make_automaton()
+    return automaton
+
+
+def identify_relevant_services(message_lower: str) -> List[str]:
+    """Identify which services are relevant to the user's query - ENHANCED with English support (message_lower is the lowercased message)"""
     # First check for specific services mentioned
-    for service, keywords in service_keywords.items():
-        if any(keyword in message_lower for keyword in keywords):
-            relevant_services.append(service)
+    automaton = service_automaton()
+    if automaton is not None:
+        found_services = set()
+        for _, services in automaton.iter(message_lower):
+            found_services.update(services)
+        relevant_services = [service for service in SERVICE_KEYWORDS if service in found_services]
+    else:
+        relevant_services = [
+            service for service, pattern in service_patterns().items()
+            if pattern.search(message_lower)
+        ]
 
     # If specific services found, return them
     if relevant_services:
         return relevant_services
 
     # If it's a general query and no specific services, include all services
-    if is_general_query:
-        return list(service_keywords.keys())
+    if general_pattern().search(message_lower):
+        return list(SERVICE_KEYWORDS.keys())
 
     # If nothing found but query seems to be about benefits, include all - ENHANCED with English
-    benefit_phrases = [
-        # Hebrew
-        'מה מגיע', 'איך מגיע', 'זכויות', 'הטבות',
-        # English
-        'what do i get', 'what am i entitled', 'what are my benefits', 'what coverage',
-        'what services', 'my benefits', 'my rights', 'entitled to'
-    ]
-
-    if any(phrase in message_lower for phrase in benefit_phrases):
-        return list(service_keywords.keys())
+    if benefit_pattern().search(message_lower):
+        return list(SERVICE_KEYWORDS.keys())
 
     return relevant_services
 
 
+# Keep connections to Azure OpenAI open between chat turns. httpx drops idle
+# connections after 5 seconds by default, which is shorter than a user takes
+# to type the next message, so most turns paid for a new TLS handshake
+OPENAI_CONNECTION_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=120)
+
+# Upper bound on the generated answer. Answers are a few hundred tokens; a
+# comparison across all HMOs and tiers in Hebrew is the longest and stays
+# well under this, so it only stops runaway generations
+MAX_RESPONSE_TOKENS = 2000
+
 # Azure OpenAI client initialization
 try:
     client = AzureOpenAI(
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        http_client=DefaultHttpxClient(limits=OPENAI_CONNECTION_LIMITS)
     )
     deployment_name = "gpt-4o"
     logger.info("Azure OpenAI client initialized successfully")
@@ -598,33 +779,41 @@ class ChatResponse(BaseModel):
 
 
 # ENHANCED: Better collection phase transition detection - BILINGUAL
-def should_transition_to_qa(message: str, user_info: UserInfo) -> tuple[bool, bool]:
+# Confirmation words - BILINGUAL
+CONFIRMATION_WORDS = frozenset({
+    # Hebrew
+    'כן', 'נכון', 'אישור', 'מאשר', 'אוקיי', 'בסדר',
+    # English
+    'yes', 'correct', 'confirm', 'right', 'okay', 'ok', 'sure'
+})
+
+# Question indicators - BILINGUAL
+QUESTION_INDICATORS = frozenset({
+    # Hebrew
+    'מה מגיע', 'איך', 'מתי', 'איפה', 'כמה', 'אילו', 'שירותים', 'הטבות', 'הריון',
+    # English
+    'what do i get', 'what am i entitled', 'how', 'when', 'where', 'how much',
+    'which', 'services', 'benefits', 'pregnancy', 'what about', 'can i get'
+})
+
+@lru_cache(maxsize=None)
+def confirmation_pattern():
+    return keyword_pattern(CONFIRMATION_WORDS)
+
+
+@lru_cache(maxsize=None)
+def question_pattern():
+    return keyword_pattern(QUESTION_INDICATORS)
+
+
+def should_transition_to_qa(message_lower: str, user_info: UserInfo) -> tuple[bool, bool]:
     """
     Determine if we should transition from collection to QA phase
+    message_lower is the lowercased user message
     Returns: (should_transition, is_question_not_confirmation)
     """
-    message_lower = message.lower()
-
-    # Confirmation words - BILINGUAL
-    confirmation_words = [
-        # Hebrew
-        'כן', 'נכון', 'אישור', 'מאשר', 'אוקיי', 'בסדר', 'נכון',
-        # English
-        'yes', 'correct', 'confirm', 'right', 'okay', 'ok', 'sure', 'confirm'
-    ]
-
-    is_confirmation = any(word in message_lower for word in confirmation_words)
-
-    # Question indicators - BILINGUAL
-    question_indicators = [
-        # Hebrew
-        'מה מגיע', 'איך', 'מתי', 'איפה', 'כמה', 'אילו', 'שירותים', 'הטבות', 'הריון',
-        # English
-        'what do i get', 'what am i entitled', 'how', 'when', 'where', 'how much',
-        'which', 'services', 'benefits', 'pregnancy', 'what about', 'can i get'
-    ]
-
-    is_question = any(indicator in message_lower for indicator in question_indicators)
+    is_confirmation = confirmation_pattern().search(message_lower) is not None
+    is_question = question_pattern().search(message_lower) is not None
 
     should_transition = is_confirmation or is_question
 
@@ -753,232 +942,313 @@ User Information:
 **If the knowledge base above contains information (even if incomplete) - you MUST use it and not say there's no information!**
 """
 
-def extract_user_info_from_conversation(message: str, current_info: UserInfo) -> UserInfo:
-    """Extract user information from the message - ENHANCED with English support"""
-    import re
 
-    # Create a copy to modify
-    info_dict = current_info.dict()
-    message_lower = message.lower()
-    logger.info(f"message_lower: {message_lower}")
+@lru_cache(maxsize=256)
+def render_collection_prompt(language, user_info_items):
+    """
+    Render the collection system prompt. user_info_items is the tuple of the
+    user info (field, value) pairs, so identical turns reuse the rendered
+    prompt and the dict is only built when the prompt is rendered.
+    """
+    template = COLLECTION_PROMPT_HEBREW if language == "hebrew" else COLLECTION_PROMPT_ENGLISH_ENHANCED
+    return template.format(user_info=dict(user_info_items))
+
 
-    # **ENHANCED: Add validation to ensure we're not parsing assistant messages - BILINGUAL**
-    assistant_phrases = [
-        # Hebrew phrases
-        'בואו נתחיל', 'נתחיל באיסוף', 'איסוף המידע', 'נא להזין',
-        'בבקשה הזן', 'מה השם', 'איך קורא לך', 'תודה', 'מצוין',
-        'עכשיו נעבור', 'הבא צריך', 'נדרש מידע', 'אסוף מידע',
-        # English phrases - ENHANCED
-        'let\'s start', 'let\'s', 'we\'ll start', 'start collecting', 'collecting information',
-        'collecting the information', 'please enter', 'please provide', 'what is your name',
-        'what\'s your name', 'thank you', 'excellent', 'now we\'ll move', 'next we need',
-        'information required', 'collect information', 'great', 'perfect', 'moving on',
-        'next step', 'i need to collect', 'need to gather', 'let me collect',
-        'information gathering', 'data collection', 'we need', 'i\'ll need'
+@lru_cache(maxsize=256)
+def render_qa_prompt(language, first_name, last_name, hmo_name, insurance_tier, age, knowledge_context):
+    """
+    Render the Q&A system prompt. Retries and clarifications usually repeat the
+    same user info and knowledge context, so the rendered prompt is cached.
+    """
+    if language == "hebrew":
+        template, not_specified = QA_PROMPT_HEBREW, "לא צוין"
+    else:
+        template, not_specified = QA_PROMPT_ENGLISH_ENHANCED, "Not specified"
+    return template.format(
+        first_name=first_name or "",
+        last_name=last_name or "",
+        hmo_name=hmo_name or not_specified,
+        insurance_tier=insurance_tier or not_specified,
+        age=age or not_specified,
+        knowledge_context=knowledge_context
+    )
+
+# **ENHANCED: Add validation to ensure we're not parsing assistant messages - BILINGUAL**
+ASSISTANT_PHRASES = frozenset({
+    # Hebrew phrases
+    'בואו נתחיל', 'נתחיל באיסוף', 'איסוף המידע', 'נא להזין',
+    'בבקשה הזן', 'מה השם', 'איך קורא לך', 'תודה', 'מצוין',
+    'עכשיו נעבור', 'הבא צריך', 'נדרש מידע', 'אסוף מידע',
+    # English phrases - ENHANCED
+    'let\'s start', 'let\'s', 'we\'ll start', 'start collecting', 'collecting information',
+    'collecting the information', 'please enter', 'please provide', 'what is your name',
+    'what\'s your name', 'thank you', 'excellent', 'now we\'ll move', 'next we need',
+    'information required', 'collect information', 'great', 'perfect', 'moving on',
+    'next step', 'i need to collect', 'need to gather', 'let me collect',
+    'information gathering', 'data collection', 'we need', 'i\'ll need'
+})
+
+# Gender keywords - ENHANCED with English support (checked in this order)
+GENDER_KEYWORDS = {
+    'זכר': [
+        # Hebrew
+        'זכר', 'גבר', 'בן',
+        # English
+        'male', 'man', 'boy', 'm'
+    ],
+    'נקבה': [
+        # Hebrew
+        'נקבה', 'אישה', 'בת',
+        # English
+        'female', 'woman', 'girl', 'f'
+    ],
+    'אחר': [
+        # Hebrew
+        'אחר',
+        # English
+        'other', 'non-binary', 'prefer not to say'
     ]
+}
+
+# HMO name keywords - ENHANCED with English variations
+USER_HMO_KEYWORDS = {
+    'מכבי': ['מכבי', 'maccabi', 'macabi'],
+    'מאוחדת': ['מאוחדת', 'meuhedet', 'united', 'meuched'],
+    'כללית': ['כללית', 'clalit', 'general', 'klalit']
+}
+
+# Insurance tier keywords - ENHANCED with English support
+USER_TIER_KEYWORDS = {
+    'זהב': ['זהב', 'gold', 'premium'],
+    'כסף': ['כסף', 'silver', 'standard'],
+    'ארד': ['ארד', 'bronze', 'basic']
+}
+
+
+# One regex per phrase list or category. Categories are still tried in order,
+# so the first category with any keyword in the message wins, as before.
+@lru_cache(maxsize=None)
+def assistant_phrase_pattern():
+    return keyword_pattern(ASSISTANT_PHRASES)
+
+
+@lru_cache(maxsize=None)
+def gender_patterns():
+    return {gender: keyword_pattern(keywords) for gender, keywords in GENDER_KEYWORDS.items()}
+
+
+@lru_cache(maxsize=None)
+def user_hmo_patterns():
+    return {hmo: keyword_pattern(keywords) for hmo, keywords in USER_HMO_KEYWORDS.items()}
+
+
+@lru_cache(maxsize=None)
+def user_tier_patterns():
+    return {tier: keyword_pattern(keywords) for tier, keywords in USER_TIER_KEYWORDS.items()}
+
+
+# Age patterns - Hebrew and English context patterns, compiled once
+AGE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    # Hebrew patterns
+    r'גיל[:\s]*(\d{1,2})',
+    r'בן[:\s]*(\d{1,2})',
+    r'בת[:\s]*(\d{1,2})',
+    # English patterns
+    r'age[:\s]*(\d{1,2})',
+    r'i am[:\s]*(\d{1,2})',
+    r'i\'m[:\s]*(\d{1,2})',
+    r'(\d{1,2})[:\s]*years old',
+    r'(\d{1,2})[:\s]*yrs old',
+    # Just a number by itself
+    r'^(\d{1,2})$'
+)]
+
+# All age patterns in one regex, so messages without an age are scanned once.
+# It only tells whether any pattern matches: the patterns are still tried in
+# order to pick the age, since the first pattern wins, not the leftmost match
+AGE_ANY_RE = re.compile('|'.join(f'(?:{pattern.pattern})' for pattern in AGE_PATTERNS), re.IGNORECASE)
+
+# ID and HMO card numbers: an isolated 9-digit number
+ID_RE = re.compile(r'\b\d{9}\b')
+
+
+# **FIX: Add length validation - real names are usually 2-20 characters per part**
+def is_valid_name_part(name_part):
+    return (
+            2 <= len(name_part) <= 20 and  # Reasonable length
+            not any(map(str.isdigit, name_part)) and  # No digits
+            not assistant_phrase_pattern().search(name_part)  # No assistant phrases
+    )
 
-    # **ENHANCED: Better detection of assistant messages**
-    # Check for long phrases that are clearly assistant responses
-    if (len(message.split()) > 3 and
-            any(phrase in message_lower for phrase in assistant_phrases)):
-        logger.info(f"Skipping extraction - message appears to be from assistant: {message}")
+
+def extract_user_info_from_conversation(message: str, current_info: UserInfo, message_lower: str) -> UserInfo:
+    """Extract user information from the message (message_lower is its lowercased form) - ENHANCED with English support"""
+    # Nothing left to extract once every field is filled in
+    if all(current_info.dict().values()):
         return current_info
 
-    # Also skip if message is too long to be user input (likely assistant response)
-    if len(message.split()) > 8:
+    # Only the fields extracted from this message
+    updates = {}
+    logger.info(f"message_lower: {message_lower}")
+
+    # Split once, the word count gates the checks below
+    name_parts = message.split()
+    word_count = len(name_parts)
+
+    # Skip if message is too long to be user input (likely assistant response)
+    if word_count > 8:
         logger.info(f"Skipping extraction - message too long, likely assistant response: {message}")
         return current_info
 
+    # **ENHANCED: Better detection of assistant messages**
+    # Check for long phrases that are clearly assistant responses
+    if (word_count > 3 and
+            assistant_phrase_pattern().search(message_lower)):
+        logger.info(f"Skipping extraction - message appears to be from assistant: {message}")
+        return current_info
+
     # Extract gender - ENHANCED with English support
     if not current_info.gender:
-        gender_keywords = {
-            'זכר': [
-                # Hebrew
-                'זכר', 'גבר', 'בן',
-                # English
-                'male', 'man', 'boy', 'm'
-            ],
-            'נקבה': [
-                # Hebrew
-                'נקבה', 'אישה', 'בת',
-                # English
-                'female', 'woman', 'girl', 'f'
-            ],
-            'אחר': [
-                # Hebrew
-                'אחר',
-                # English
-                'other', 'non-binary', 'prefer not to say'
-            ]
-        }
-
-        for gender, keywords in gender_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                info_dict['gender'] = gender
+        for gender, pattern in gender_patterns().items():
+            if pattern.search(message_lower):
+                updates['gender'] = gender
                 logger.info(f"Extracted gender: {gender}")
                 break
 
     # Extract age - ENHANCED with English context patterns
-    if not current_info.age:
-        age_patterns = [
-            # Hebrew patterns
-            r'גיל[:\s]*(\d{1,2})',
-            r'בן[:\s]*(\d{1,2})',
-            r'בת[:\s]*(\d{1,2})',
-            # English patterns
-            r'age[:\s]*(\d{1,2})',
-            r'i am[:\s]*(\d{1,2})',
-            r'i\'m[:\s]*(\d{1,2})',
-            r'(\d{1,2})[:\s]*years old',
-            r'(\d{1,2})[:\s]*yrs old',
-            # Just a number by itself
-            r'^(\d{1,2})$'
-        ]
-
-        for pattern in age_patterns:
-            age_match = re.search(pattern, message, re.IGNORECASE)
+    if not current_info.age and AGE_ANY_RE.search(message):
+        for pattern in AGE_PATTERNS:
+            age_match = pattern.search(message)
             if age_match:
                 age = int(age_match.group(1))
                 if 0 <= age <= 120:
-                    info_dict['age'] = age
+                    updates['age'] = age
                     logger.info(f"Extracted age: {age}")
                     break
 
     # Extract HMO name - ENHANCED with English variations
     if not current_info.hmo_name:
-        hmo_keywords = {
-            'מכבי': ['מכבי', 'maccabi', 'macabi'],
-            'מאוחדת': ['מאוחדת', 'meuhedet', 'united', 'meuched'],
-            'כללית': ['כללית', 'clalit', 'general', 'klalit']
-        }
-
-        for hmo, keywords in hmo_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                info_dict['hmo_name'] = hmo
+        for hmo, pattern in user_hmo_patterns().items():
+            if pattern.search(message_lower):
+                updates['hmo_name'] = hmo
                 logger.info(f"Extracted HMO: {hmo}")
                 break
 
     # Extract insurance tier - ENHANCED with English support
     if not current_info.insurance_tier:
-        tier_keywords = {
-            'זהב': ['זהב', 'gold', 'premium'],
-            'כסף': ['כסף', 'silver', 'standard'],
-            'ארד': ['ארד', 'bronze', 'basic']
-        }
-
-        for tier, keywords in tier_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                info_dict['insurance_tier'] = tier
+        for tier, pattern in user_tier_patterns().items():
+            if pattern.search(message_lower):
+                updates['insurance_tier'] = tier
                 logger.info(f"Extracted insurance tier: {tier}")
                 break
 
-    # **FIX: Add length validation - real names are usually 2-20 characters per part**
-    def is_valid_name_part(name_part):
-        return (
-                2 <= len(name_part) <= 20 and  # Reasonable length
-                not any(char.isdigit() for char in name_part) and  # No digits
-                not any(phrase in name_part for phrase in assistant_phrases)  # No assistant phrases
-        )
-
     # Extract first name (if not already set)
-    if not current_info.first_name and not current_info.last_name:
-        # If user provides full name
-        name_parts = message.strip().split()
+    first_name, last_name = current_info.first_name, current_info.last_name
+    if not first_name and not last_name:
+        # If user provides full name (name_parts is the split message)
         if (len(name_parts) >= 2 and
                 all(is_valid_name_part(part) for part in name_parts[:2])):  # Validate both parts
-            info_dict['first_name'] = name_parts[0]
-            info_dict['last_name'] = ' '.join(name_parts[1:])
+            updates['first_name'] = name_parts[0]
+            updates['last_name'] = ' '.join(name_parts[1:])
             logger.info(f"Extracted full name: {name_parts[0]} {' '.join(name_parts[1:])}")
         elif (len(name_parts) == 1 and
               is_valid_name_part(name_parts[0])):
-            info_dict['first_name'] = name_parts[0]
+            updates['first_name'] = name_parts[0]
             logger.info(f"Extracted first name: {name_parts[0]}")
 
-    elif not current_info.last_name and current_info.first_name:
+    elif not last_name and first_name:
         # Extract last name
         name_candidate = message.strip()
         if is_valid_name_part(name_candidate):
-            info_dict['last_name'] = name_candidate
+            updates['last_name'] = name_candidate
             logger.info(f"Extracted last name: {name_candidate}")
 
     # Extract ID number (9 digits) - only if it's isolated and looks like an ID
-    id_match = re.search(r'\b\d{9}\b', message)
-    if id_match and not current_info.id_number:
+    stripped_message = message.strip()
+    if len(stripped_message) == 9 and stripped_message.isdecimal():
+        # The message is just the number (the common case), no regex needed
+        # (isdecimal matches the same digits as \d)
+        nine_digits = stripped_message
+    else:
+        id_match = ID_RE.search(message)
+        nine_digits = id_match.group() if id_match else None
+
+    id_number = current_info.id_number
+    if nine_digits and not id_number:
         # Additional validation: make sure it's not part of a longer number
-        id_candidate = id_match.group()
+        id_candidate = nine_digits
         # Check if this is the entire message (user just entered ID) or clearly separated
-        if (message.strip() == id_candidate or
-                len(message.split()) <= 2):  # Short message likely to be just ID
-            info_dict['id_number'] = id_candidate
+        if (stripped_message == id_candidate or
+                word_count <= 2):  # Short message likely to be just ID
+            updates['id_number'] = id_candidate
             logger.info(f"Extracted ID number: {id_candidate}")
 
     # Extract HMO card number (9 digits, different from ID)
-    if not current_info.hmo_card_number and current_info.id_number:
-        card_match = re.search(r'\b\d{9}\b', message)
-        if card_match and card_match.group() != current_info.id_number:
-            info_dict['hmo_card_number'] = card_match.group()
-            logger.info(f"Extracted HMO card number: {card_match.group()}")
-
-    return UserInfo(**info_dict)
+    if not current_info.hmo_card_number and id_number:
+        # Same number as found for the ID above
+        if nine_digits and nine_digits != id_number:
+            updates['hmo_card_number'] = nine_digits
+            logger.info(f"Extracted HMO card number: {nine_digits}")
+
+    # Copy with the new values instead of re-validating every field (the
+    # extracted values already satisfy the validators)
+    return current_info.copy(update=updates) if updates else current_info
+
+
+# Display translations for format_user_info_for_display
+GENDER_TRANSLATION = {
+    'hebrew': {
+        'זכר': 'זכר',
+        'נקבה': 'נקבה',
+        'אחר': 'אחר'
+    },
+    'english': {
+        'זכר': 'Male',
+        'נקבה': 'Female',
+        'אחר': 'Other'
+    }
+}
+
+HMO_TRANSLATION = {
+    'hebrew': {
+        'מכבי': 'מכבי',
+        'מאוחדת': 'מאוחדת',
+        'כללית': 'כללית'
+    },
+    'english': {
+        'מכבי': 'Maccabi',
+        'מאוחדת': 'Meuhedet',
+        'כללית': 'Clalit'
+    }
+}
+
+TIER_TRANSLATION = {
+    'hebrew': {
+        'זהב': 'זהב',
+        'כסף': 'כסף',
+        'ארד': 'ארד'
+    },
+    'english': {
+        'זהב': 'Gold',
+        'כסף': 'Silver',
+        'ארד': 'Bronze'
+    }
+}
 
 
 def format_user_info_for_display(user_info: UserInfo, language: str = "hebrew") -> dict:
     """Format user info for display in the correct language"""
-
-    # Gender translation
-    gender_translation = {
-        'hebrew': {
-            'זכר': 'זכר',
-            'נקבה': 'נקבה',
-            'אחר': 'אחר'
-        },
-        'english': {
-            'זכר': 'Male',
-            'נקבה': 'Female',
-            'אחר': 'Other'
-        }
-    }
-
-    # HMO translation
-    hmo_translation = {
-        'hebrew': {
-            'מכבי': 'מכבי',
-            'מאוחדת': 'מאוחדת',
-            'כללית': 'כללית'
-        },
-        'english': {
-            'מכבי': 'Maccabi',
-            'מאוחדת': 'Meuhedet',
-            'כללית': 'Clalit'
-        }
-    }
-
-    # Tier translation
-    tier_translation = {
-        'hebrew': {
-            'זהב': 'זהב',
-            'כסף': 'כסף',
-            'ארד': 'ארד'
-        },
-        'english': {
-            'זהב': 'Gold',
-            'כסף': 'Silver',
-            'ארד': 'Bronze'
-        }
-    }
+    not_provided = "לא סופק" if language == "hebrew" else "Not provided"
 
     display_info = {
-        'first_name': user_info.first_name or ("לא סופק" if language == "hebrew" else "Not provided"),
-        'last_name': user_info.last_name or ("לא סופק" if language == "hebrew" else "Not provided"),
-        'id_number': user_info.id_number or ("לא סופק" if language == "hebrew" else "Not provided"),
-        'gender': gender_translation[language].get(user_info.gender,
-                                                   "לא סופק" if language == "hebrew" else "Not provided"),
-        'age': user_info.age or ("לא סופק" if language == "hebrew" else "Not provided"),
-        'hmo_name': hmo_translation[language].get(user_info.hmo_name,
-                                                  "לא סופק" if language == "hebrew" else "Not provided"),
-        'hmo_card_number': user_info.hmo_card_number or ("לא סופק" if language == "hebrew" else "Not provided"),
-        'insurance_tier': tier_translation[language].get(user_info.insurance_tier,
-                                                         "לא סופק" if language == "hebrew" else "Not provided")
+        'first_name': user_info.first_name or not_provided,
+        'last_name': user_info.last_name or not_provided,
+        'id_number': user_info.id_number or not_provided,
+        'gender': GENDER_TRANSLATION[language].get(user_info.gender, not_provided),
+        'age': user_info.age or not_provided,
+        'hmo_name': HMO_TRANSLATION[language].get(user_info.hmo_name, not_provided),
+        'hmo_card_number': user_info.hmo_card_number or not_provided,
+        'insurance_tier': TIER_TRANSLATION[language].get(user_info.insurance_tier, not_provided)
     }
 
     return display_info
@@ -1030,8 +1300,8 @@ async def debug_knowledge():
             "title": service_data['structured_data']['title'],
             "description_length": len(service_data['structured_data']['description']),
             "services_count": len(service_data['structured_data']['services']),
-            "raw_html_length": len(service_data['raw_html']),
-            "first_100_chars": service_data['raw_html'][:100]
+            "raw_html_length": service_data['raw_html_length'],
+            "first_100_chars": service_data['raw_html_preview']
         }
 
     return debug_info
@@ -1050,7 +1320,7 @@ async def debug_simple():
     if 'pregnancy' in knowledge_base:
         pregnancy = knowledge_base['pregnancy']
         result["pregnancy_info"] = {
-            "raw_html_length": len(pregnancy['raw_html']),
+            "raw_html_length": pregnancy['raw_html_length'],
             "structured_services_count": len(pregnancy['structured_data']['services']),
             "title": pregnancy['structured_data']['title'],
             "first_service_name": pregnancy['structured_data']['services'][0]['service_name'] if
@@ -1059,7 +1329,7 @@ async def debug_simple():
 
         # Test service detection
         test_query = "מה מגיע לי מבחינת הריון"
-        relevant_services = identify_relevant_services(test_query)
+        relevant_services = identify_relevant_services(test_query.lower())
         result["service_detection"] = {
             "query": test_query,
             "detected_services": relevant_services,
@@ -1069,129 +1339,137 @@ async def debug_simple():
     return result
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    try:
-        logger.info(f"Chat request received - Phase: {request.phase}, Language: {request.language}")
-
-        # Extract user info from the message if in collection phase
-        updated_user_info = request.user_info
-        if request.phase == "collection":
-            updated_user_info = extract_user_info_from_conversation(request.message, request.user_info)
-        logger.info(f"Updated user info: {updated_user_info}")
-        # Check if we should transition from collection to Q&A
-        current_phase = request.phase
-        if request.phase == "collection":
-            logger.info(f"🔄 DEBUG: Collection phase, checking for transition...")
-
-            should_transition, is_question = should_transition_to_qa(request.message, updated_user_info)
-
-            if should_transition:
-                current_phase = "qa"
-                logger.info(f"🎉 DEBUG: Transitioning to QA phase!")
-
-                if is_question:
-                    # User asked a question, go straight to answering it
-                    logger.info(f"🚀 DEBUG: User asked question, proceeding to answer...")
-                else:
-                    # User confirmed, give transition message
-                    if request.language == "hebrew":
-                        assistant_response = "מצוין! עכשיו אני יכול לעזור לך עם שאלות על שירותי הבריאות שלך בהתבסס על מאגר המידע המפורט. איך אוכל לעזור?"
-                    else:
-                        assistant_response = "Great! Now I can help you with questions about your health services based on our detailed database. How can I assist you?"
-
-                    return ChatResponse(
-                        response=assistant_response,
-                        updated_user_info=updated_user_info,
-                        phase=current_phase,
-                        is_complete=True
-                    )
+def prepare_chat(request: ChatRequest):
+    """
+    Run a chat turn up to the LLM call: extract user info, handle the phase
+    transition and build the messages to send.
+
+    Returns:
+        Tuple of (updated_user_info, current_phase, messages, fixed_response).
+        When fixed_response is set the turn is answered without the LLM and
+        messages is None.
+    """
+    logger.info(f"Chat request received - Phase: {request.phase}, Language: {request.language}")
+
+    # Lowercase the message once for all the keyword checks below
+    message_lower = request.message.lower()
+
+    # Extract user info from the message if in collection phase
+    updated_user_info = request.user_info
+    if request.phase == "collection":
+        updated_user_info = extract_user_info_from_conversation(request.message, request.user_info, message_lower)
+    logger.info(f"Updated user info: {updated_user_info}")
+    # Check if we should transition from collection to Q&A
+    current_phase = request.phase
+    if request.phase == "collection":
+        logger.info(f"🔄 DEBUG: Collection phase, checking for transition...")
+
+        should_transition, is_question = should_transition_to_qa(message_lower, updated_user_info)
+
+        if should_transition:
+            current_phase = "qa"
+            logger.info(f"🎉 DEBUG: Transitioning to QA phase!")
+
+            if is_question:
+                # User asked a question, go straight to answering it
+                logger.info(f"🚀 DEBUG: User asked question, proceeding to answer...")
             else:
-                logger.info(f"❌ DEBUG: No confirmation or question detected, staying in collection phase")
-
-        # # Get comprehensive knowledge context for Q&A phase
-        knowledge_context = ""
-        if current_phase == "qa":
-            # Detect hypothetical queries (asking about other HMOs/tiers)
-            hypothetical_context = detect_hypothetical_query(request.message)
-            logger.info(f"🤔 Hypothetical context detected: {hypothetical_context}")
-
-            # **ENHANCED: Use conversation history for better service detection**
-            relevant_services = identify_relevant_services_with_context(
-                request.message,
-                request.conversation_history
-            )
-            logger.info(f"📋 Identified relevant services: {relevant_services}")
+                # User confirmed, give transition message
+                if request.language == "hebrew":
+                    assistant_response = "מצוין! עכשיו אני יכול לעזור לך עם שאלות על שירותי הבריאות שלך בהתבסס על מאגר המידע המפורט. איך אוכל לעזור?"
+                else:
+                    assistant_response = "Great! Now I can help you with questions about your health services based on our detailed database. How can I assist you?"
 
-            # **IMPORTANT: Always try to get context, even for follow-ups**
-            knowledge_context = get_comprehensive_knowledge_context(
-                request.message,
-                updated_user_info,
-                hypothetical_context
-            )
+                return updated_user_info, current_phase, None, assistant_response
+        else:
+            logger.info(f"❌ DEBUG: No confirmation or question detected, staying in collection phase")
+
+    # # Get comprehensive knowledge context for Q&A phase
+    knowledge_context = ""
+    if current_phase == "qa":
+        # Detect hypothetical queries (asking about other HMOs/tiers)
+        hypothetical_context = detect_hypothetical_query(message_lower)
+        logger.info(f"🤔 Hypothetical context detected: {hypothetical_context}")
+
+        # **ENHANCED: Use conversation history for better service detection**
+        relevant_services = identify_relevant_services_with_context(
+            message_lower,
+            request.conversation_history
+        )
+        logger.info(f"📋 Identified relevant services: {relevant_services}")
 
-            logger.info(f"📝 Knowledge context length: {len(knowledge_context)}")
+        # **IMPORTANT: Always try to get context, even for follow-ups**
+        knowledge_context = get_comprehensive_knowledge_context(
+            message_lower,
+            updated_user_info,
+            hypothetical_context
+        )
 
-            # **DEBUG: Log what's happening**
-            if not knowledge_context:
-                print("❌ WARNING: No knowledge context generated!")
-                print(f"   Message: {request.message}")
-                print(f"   Hypothetical: {hypothetical_context}")
-                print(f"   Services: {relevant_services}")
-            else:
-                print("✅ Knowledge context generated successfully")
+        logger.info(f"📝 Knowledge context length: {len(knowledge_context)}")
 
-        # # Update the system prompt to handle missing context better
-        if current_phase == "collection":
-            if request.language == "hebrew":
-                system_prompt = COLLECTION_PROMPT_HEBREW.format(user_info=updated_user_info.dict())
-            else:
-                system_prompt = COLLECTION_PROMPT_ENGLISH_ENHANCED.format(user_info=updated_user_info.dict())
+        # **DEBUG: Log what's happening**
+        if not knowledge_context:
+            print("❌ WARNING: No knowledge context generated!")
+            print(f"   Message: {request.message}")
+            print(f"   Hypothetical: {hypothetical_context}")
+            print(f"   Services: {relevant_services}")
         else:
-            # **ENHANCED: Better handling when knowledge context is empty**
-            if not knowledge_context and hypothetical_context.get('hmo'):
-                # If we detected an HMO but no context, generate a helpful message
-                knowledge_context = f"המשתמש שואל על {hypothetical_context['hmo']} - יש לחפש מידע רלוונטי במאגר הידע."
-
-            if request.language == "hebrew":
-                system_prompt = QA_PROMPT_HEBREW.format(
-                    first_name=updated_user_info.first_name or "",
-                    last_name=updated_user_info.last_name or "",
-                    hmo_name=updated_user_info.hmo_name or "לא צוין",
-                    insurance_tier=updated_user_info.insurance_tier or "לא צוין",
-                    age=updated_user_info.age or "לא צוין",
-                    knowledge_context=knowledge_context
-                )
-            else:
-                system_prompt = QA_PROMPT_ENGLISH_ENHANCED.format(
-                    first_name=updated_user_info.first_name or "",
-                    last_name=updated_user_info.last_name or "",
-                    hmo_name=updated_user_info.hmo_name or "Not specified",
-                    insurance_tier=updated_user_info.insurance_tier or "Not specified",
-                    age=updated_user_info.age or "Not specified",
-                    knowledge_context=knowledge_context
-                )
-
-        # Prepare messages for OpenAI
-        messages = [{"role": "system", "content": system_prompt}]
-
-        # Add conversation history (last 6 messages to avoid token limits)
-        recent_history = request.conversation_history[-6:] if len(
-            request.conversation_history) > 6 else request.conversation_history
-        for msg in recent_history:
-            messages.append({"role": msg.role, "content": msg.content})
-
-        # Add current user message
-        messages.append({"role": "user", "content": request.message})
+            print("✅ Knowledge context generated successfully")
+
+    # # Update the system prompt to handle missing context better
+    if current_phase == "collection":
+        system_prompt = render_collection_prompt(request.language, tuple(updated_user_info))
+    else:
+        # **ENHANCED: Better handling when knowledge context is empty**
+        if not knowledge_context and hypothetical_context.get('hmo'):
+            # If we detected an HMO but no context, generate a helpful message
+            knowledge_context = f"המשתמש שואל על {hypothetical_context['hmo']} - יש לחפש מידע רלוונטי במאגר הידע."
+
+        system_prompt = render_qa_prompt(
+            request.language,
+            updated_user_info.first_name,
+            updated_user_info.last_name,
+            updated_user_info.hmo_name,
+            updated_user_info.insurance_tier,
+            updated_user_info.age,
+            knowledge_context
+        )
+
+    # Prepare messages for OpenAI: system prompt, conversation history (last 6
+    # messages to avoid token limits) and the current user message
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *({"role": msg.role, "content": msg.content} for msg in request.conversation_history[-6:]),
+        {"role": "user", "content": request.message}
+    ]
+
+    logger.info(f"Knowledge context length: {len(knowledge_context)} chars")
+
+    return updated_user_info, current_phase, messages, None
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest):
+    try:
+        # The extraction/detection work and the OpenAI call are blocking, so
+        # they run in the threadpool instead of holding up the event loop
+        updated_user_info, current_phase, messages, fixed_response = await run_in_threadpool(prepare_chat, request)
+        if fixed_response is not None:
+            return ChatResponse(
+                response=fixed_response,
+                updated_user_info=updated_user_info,
+                phase=current_phase,
+                is_complete=True
+            )
 
         # Call Azure OpenAI
         logger.info(f"Calling Azure OpenAI with model: {deployment_name}")
-        logger.info(f"Knowledge context length: {len(knowledge_context)} chars")
 
-        response = client.chat.completions.create(
+        response = await run_in_threadpool(
+            client.chat.completions.create,
             model=deployment_name,
             messages=messages,
-            max_tokens=5000,  # Reduced to focus on specific answers
+            max_tokens=MAX_RESPONSE_TOKENS,
             temperature=0.3  # Very low temperature for precise, instruction-following responses
         )
 
@@ -1211,6 +1489,58 @@ async def chat_endpoint(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same as /chat, but streams the answer as it is generated.
+    The response is newline-delimited JSON: first a "meta" line with the
+    updated user info and phase, then "delta" lines with pieces of the answer,
+    and finally a "done" line (or an "error" line if generation fails).
+    """
+    try:
+        updated_user_info, current_phase, messages, fixed_response = await run_in_threadpool(prepare_chat, request)
+    except Exception as e:
+        logger.error(f"Error in chat stream endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def ndjson_line(data: dict) -> str:
+        return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+    def generate():
+        yield ndjson_line({
+            "type": "meta",
+            "updated_user_info": updated_user_info.dict(),
+            "phase": current_phase,
+            "is_complete": fixed_response is not None
+        })
+
+        if fixed_response is not None:
+            yield ndjson_line({"type": "delta", "content": fixed_response})
+            yield ndjson_line({"type": "done"})
+            return
+
+        try:
+            logger.info(f"Calling Azure OpenAI (streaming) with model: {deployment_name}")
+            stream = client.chat.completions.create(
+                model=deployment_name,
+                messages=messages,
+                max_tokens=MAX_RESPONSE_TOKENS,
+                temperature=0.3,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield ndjson_line({"type": "delta", "content": chunk.choices[0].delta.content})
+            yield ndjson_line({"type": "done"})
+        except Exception as e:
+            logger.error(f"Error while streaming chat response: {e}")
+            yield ndjson_line({"type": "error", "detail": str(e)})
+
+    # A sync generator is iterated in the threadpool, so the blocking OpenAI
+    # stream doesn't hold up the event loop
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
 
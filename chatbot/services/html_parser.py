@@ -1,59 +1,294 @@
 import os
+import pickle
 import re
-from typing import Dict, List, Optional
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
 import logging
 
 logger = logging.getLogger(__name__)
 
+# With lxml, BeautifulSoup uses it as its tree builder and the benefits table
+# and contact lists are read from a separate lxml.html tree; otherwise the
+# service pages are parsed with html.parser alone
+try:
+    from lxml import etree, html as lxml_html
+    HTML_PARSER = 'lxml'
+    # The files are decoded before parsing, so the encoding is always UTF-8
+    LXML_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+except ImportError:
+    etree = None
+    HTML_PARSER = 'html.parser'
+
+# With lxml the benefits table and the contact lists are read from an lxml
+# tree, and BeautifulSoup only builds the tags read in document order (the
+# title, description and services list). SoupStrainer moves the tags it keeps
+# up to the root, so it can't be used where sibling structure matters
+BS4_TAGS = SoupStrainer(['h2', 'p', 'ul']) if etree is not None else None
+
+# Opening tags of the elements that are read from the lxml tree
+TABLE_OR_CONTACT_RE = re.compile(r'<(?:table|h3)', re.IGNORECASE)
+
+# Upper bound on the threads parsing HTML files at startup
+MAX_WORKERS = 8
+
+# Number of get_service_benefits responses kept per parser
+BENEFITS_CACHE_SIZE = 512
+
+# The parsed services are pickled into the data directory together with the
+# mtime of every HTML file, and reused while those mtimes still match.
+# Bump the version when the parsing changes.
+SERVICES_CACHE_FILENAME = '.services_cache.pkl'
+SERVICES_CACHE_VERSION = 4
+
+# A benefits cell line that starts a tier, e.g. "זהב: ..."
+TIER_PREFIX_RE = re.compile(r'(זהב|כסף|ארד):')
+
+# Optional: search_automaton matches the SEARCH_CATEGORIES keywords in one
+# scan of the query; search_patterns is the regex fallback
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Service search: (words identifying the service type, match returned, query
+# keywords), checked in this order for each service type
+SEARCH_CATEGORIES = (
+    (('dental', 'dentel', 'שיניים'), 'dentel', ('שיניים', 'dental', 'דנטל', 'שן', 'טיפולי שיניים')),
+    (('optometry', 'אופטומטריה'), 'optometry', ('עיניים', 'ראייה', 'משקפיים', 'עדשות', 'optometry', 'בדיקות ראייה')),
+    (('pregnancy', 'pragrency', 'הריון'), 'pragrency', ('הריון', 'לידה', 'pregnancy', 'בריאות האישה', 'נשים הרות', 'הרות', 'מעקב הריון')),
+    (('alternative', 'אלטרנטיב'), 'alternative', ('אלטרנטיב', 'רפואה משלימה', 'alternative')),
+    (('communication', 'תקשורת'), 'communication_clinic', ('תקשורת', 'דיבור', 'שמיעה', 'communication')),
+    (('workshops', 'סדנאות'), 'workshops', ('סדנאות', 'הרצאות', 'workshops', 'קורסים')),
+)
+
+# HMO and tier mentions in a hypothetical query, mapped to the Hebrew name.
+# When several are mentioned the first one in these orders wins
+HYPOTHETICAL_MENTIONS = {
+    'מכבי': 'מכבי', 'maccabi': 'מכבי',
+    'מאוחדת': 'מאוחדת', 'meuhedet': 'מאוחדת',
+    'כללית': 'כללית', 'clalit': 'כללית',
+    'זהב': 'זהב', 'gold': 'זהב',
+    'כסף': 'כסף', 'silver': 'כסף',
+    'ארד': 'ארד', 'bronze': 'ארד'
+}
+HMO_ORDER = ('מכבי', 'מאוחדת', 'כללית')
+TIER_ORDER = ('זהב', 'כסף', 'ארד')
+
+
+@lru_cache(maxsize=None)
+def hypothetical_mention_pattern():
+    """One regex for all HMO and tier mentions, so the query is scanned once"""
+    return re.compile('|'.join(re.escape(word) for word in HYPOTHETICAL_MENTIONS))
+
+
+def service_type_for(file: str) -> str:
+    """Service type of an HTML file, e.g. dentel_services.html -> dentel"""
+    return file.replace('.html', '').replace('_services', '')
+
+
+@lru_cache(maxsize=None)
+def search_automaton():
+    """
+    Aho-Corasick automaton mapping each search keyword to the matches it
+    belongs to, or None if pyahocorasick isn't installed
+    """
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for _, match, keywords in SEARCH_CATEGORIES:
+        for keyword in keywords:
+            automaton.add_word(keyword, automaton.get(keyword, ()) + (match,))
+    automaton.make_automaton()
+    return automaton
+
+
+@lru_cache(maxsize=None)
+def search_patterns():
+    """
+    One alternation regex per match, used when pyahocorasick isn't installed.
+    A regex per match rather than one for all of them, since findall skips
+    keywords that overlap a keyword found before them
+    """
+    return {match: re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+            for _, match, keywords in SEARCH_CATEGORIES}
+
+
+@lru_cache(maxsize=None)
+def search_match_for(service_type: str) -> Optional[str]:
+    """The match a service type is searched as, or None if it's not a searchable service"""
+    for type_words, match, _ in SEARCH_CATEGORIES:
+        if any(word in service_type for word in type_words):
+            return match
+    return None
+
+
+def find_search_matches(query_lower: str) -> set:
+    """Matches whose keywords appear in the query"""
+    automaton = search_automaton()
+    if automaton is not None:
+        found = set()
+        for _, matches in automaton.iter(query_lower):
+            found.update(matches)
+        return found
+    return {match for match, pattern in search_patterns().items() if pattern.search(query_lower)}
+
+
+@dataclass
+class ServiceData:
+    """Parsed content of one service page"""
+    __slots__ = ('title', 'description', 'services_list', 'benefits_table', 'by_hmo_tier', 'contact_info')
+    
+    title: str
+    description: str
+    services_list: List[str]
+    benefits_table: Dict  # {service_name: {hmo: {tier: benefit_text}}}
+    by_hmo_tier: Dict  # {hmo: {tier: [(service_name, benefit_text), ...]}}
+    contact_info: Dict  # {hmo: contact_text}
+
+
 class HealthServiceParser:
     """Parser for health service HTML files"""
     
     def __init__(self, data_directory: str):
         self.data_directory = data_directory
         self.services_data = {}
-        self.load_all_services()
+        # Files are only parsed when their service is first used (see get_service);
+        # load_all_services loads them all up front
+        self.service_files, self.service_mtimes = self.index_service_files()
+        self.cache_checked = False
+        # Responses of get_service_benefits by its arguments, cleared whenever
+        # the services are reloaded
+        self.benefits_cache = {}
+    
+    def index_service_files(self) -> Tuple[Dict[str, str], Optional[Dict[str, int]]]:
+        """Map each service type to its HTML file, along with the mtime of every
+        file (None if one can't be read)"""
+        if not os.path.exists(self.data_directory):
+            logger.error(f"Data directory not found: {self.data_directory}")
+            return {}, {}
+        
+        # One directory scan gives both the file names and their stats
+        with os.scandir(self.data_directory) as it:
+            html_entries = [entry for entry in it if entry.name.endswith('.html')]
+        html_files = [entry.name for entry in html_entries]
+        logger.info(f"Found HTML files: {html_files}")
+        
+        try:
+            mtimes = {entry.name: entry.stat().st_mtime_ns for entry in html_entries}
+        except OSError:
+            mtimes = None
+        return {service_type_for(file): file for file in html_files}, mtimes
+    
+    def get_service(self, service_type: str) -> Optional[ServiceData]:
+        """Parsed data of a service type, loaded on first use"""
+        if service_type not in self.services_data and service_type in self.service_files:
+            # Take everything from the on-disk cache if it's still valid
+            if not self.cache_checked:
+                self.cache_checked = True
+                cache_path = os.path.join(self.data_directory, SERVICES_CACHE_FILENAME)
+                cached_services = self.load_cached_services(cache_path, self.service_mtimes)
+                if cached_services is not None:
+                    self.services_data.update(cached_services)
+                    logger.info(f"Loaded parsed services from cache: {cache_path}")
+            
+            if service_type not in self.services_data:
+                _, parsed_data = self.load_service_file(self.service_files[service_type])
+                if parsed_data:
+                    self.services_data[service_type] = parsed_data
+        
+        return self.services_data.get(service_type)
     
     def load_all_services(self):
         """Load all HTML service files"""
         try:
-            if not os.path.exists(self.data_directory):
-                logger.error(f"Data directory not found: {self.data_directory}")
+            self.benefits_cache.clear()
+            self.service_files, mtimes = self.index_service_files()
+            self.service_mtimes = mtimes
+            html_files = list(self.service_files.values())
+            
+            cache_path = os.path.join(self.data_directory, SERVICES_CACHE_FILENAME)
+            self.cache_checked = True
+            cached_services = self.load_cached_services(cache_path, mtimes)
+            if cached_services is not None:
+                self.services_data = cached_services
+                logger.info(f"Loaded parsed services from cache: {cache_path}")
                 return
-                
-            html_files = [f for f in os.listdir(self.data_directory) if f.endswith('.html')]
-            logger.info(f"Found HTML files: {html_files}")
             
-            for file in html_files:
-                service_type = file.replace('.html', '').replace('_services', '')
-                file_path = os.path.join(self.data_directory, file)
-                
-                logger.info(f"Processing file: {file} -> service_type: {service_type}")
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
+            # Files are independent, so they are read and parsed in a thread pool;
+            # the results are stored in file order on this thread
+            all_loaded = True
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(html_files)))) as executor:
+                results = list(executor.map(self.load_service_file, html_files))
+            
+            for service_type, parsed_data in results:
+                if parsed_data:
+                    self.services_data[service_type] = parsed_data
+                    logger.info(f"Loaded service data for: {service_type}")
                     
-                    parsed_data = self.parse_html_service(content, service_type)
-                    if parsed_data:
-                        self.services_data[service_type] = parsed_data
-                        logger.info(f"Loaded service data for: {service_type}")
-                        
-                        # Log table structure for debugging
-                        if parsed_data.get('benefits_table'):
-                            services_list = list(parsed_data['benefits_table'].keys())
-                            logger.info(f"  Services in {service_type}: {services_list}")
-                
-                except Exception as e:
-                    logger.error(f"Error loading {file}: {e}")
+                    # Log table structure for debugging
+                    if parsed_data.benefits_table:
+                        services_list = list(parsed_data.benefits_table.keys())
+                        logger.info(f"  Services in {service_type}: {services_list}")
+                else:
+                    all_loaded = False
+            
+            # Only cache when every file parsed, so failed files are retried next time
+            if all_loaded and mtimes is not None:
+                self.save_cached_services(cache_path, mtimes)
                     
         except Exception as e:
             logger.error(f"Error loading services: {e}")
     
-    def parse_html_service(self, html_content: str, service_type: str) -> Dict:
+    def load_service_file(self, file: str) -> Tuple[str, Optional[ServiceData]]:
+        """Read and parse one HTML service file; the parsed data is None if it failed"""
+        service_type = service_type_for(file)
+        file_path = os.path.join(self.data_directory, file)
+        
+        logger.info(f"Processing file: {file} -> service_type: {service_type}")
+        
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            return service_type, self.parse_html_service(content, service_type)
+        
+        except Exception as e:
+            logger.error(f"Error loading {file}: {e}")
+            return service_type, None
+    
+    def load_cached_services(self, cache_path: str, mtimes: Dict[str, int]) -> Optional[Dict]:
+        """Load the pickled services data, or None if it is missing, stale or from another version"""
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception:
+            return None
+        
+        if cached.get('version') != SERVICES_CACHE_VERSION or cached.get('mtimes') != mtimes:
+            return None
+        return cached['data']
+    
+    def save_cached_services(self, cache_path: str, mtimes: Dict[str, int]):
+        """Pickle the parsed services data for the next startup"""
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump({'version': SERVICES_CACHE_VERSION, 'mtimes': mtimes, 'data': self.services_data},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logger.warning(f"Could not cache services data: {e}")
+    
+    def parse_html_service(self, html_content: str, service_type: str) -> Optional[ServiceData]:
         """Parse HTML content to extract service information"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            # Without any tags there is nothing to extract, so skip the parsers
+            if '<' not in html_content:
+                return ServiceData(title=service_type, description="", services_list=[],
+                                   benefits_table={}, by_hmo_tier={}, contact_info={})
+            
+            soup = BeautifulSoup(html_content, HTML_PARSER, parse_only=BS4_TAGS)
             
             # Extract title
             title = soup.find('h2')
@@ -63,33 +298,50 @@ class HealthServiceParser:
             description_p = soup.find('p')
             description = description_p.get_text().strip() if description_p else ""
             
-            # Extract services list
+            # Extract services list: the first list after a paragraph, found in
+            # one pass over the paragraphs and lists in document order
             services_list = []
-            ul_elements = soup.find_all('ul')
-            for ul in ul_elements:
-                if ul.find_previous('p'):  # Only take lists after description
-                    li_elements = ul.find_all('li')
+            seen_p = False
+            for element in soup.find_all(['p', 'ul']):
+                if element.name == 'p':
+                    seen_p = True
+                elif seen_p:  # Only take lists after description
+                    li_elements = element.find_all('li')
                     for li in li_elements:
                         services_list.append(li.get_text().strip())
                     break
             
-            # Extract table data
-            table_data = self.extract_table_data(soup)
-            
-            # Extract contact information
-            contact_info = self.extract_contact_info(soup)
+            if etree is not None:
+                # The lxml tree is only needed for a table or contact headings
+                # (None for a document without any elements)
+                tree = None
+                if TABLE_OR_CONTACT_RE.search(html_content):
+                    tree = etree.fromstring(html_content.encode('utf-8'), LXML_PARSER)
+                
+                # Extract table data
+                table_data = self.extract_table_data_lxml(tree) if tree is not None else {}
+                
+                # Extract contact information
+                contact_info = self.extract_contact_info_lxml(tree) if tree is not None else {}
+            else:
+                # Extract table data
+                table_data = self.extract_table_data(soup)
+                
+                # Extract contact information
+                contact_info = self.extract_contact_info(soup)
             
-            return {
-                'title': title_text,
-                'description': description,
-                'services_list': services_list,
-                'benefits_table': table_data,
-                'contact_info': contact_info
-            }
+            return ServiceData(
+                title=title_text,
+                description=description,
+                services_list=services_list,
+                benefits_table=table_data,
+                by_hmo_tier=self.index_benefits(table_data),
+                contact_info=contact_info
+            )
             
         except Exception as e:
             logger.error(f"Error parsing HTML for {service_type}: {e}")
-            return {}
+            return None
     
     def extract_table_data(self, soup: BeautifulSoup) -> Dict:
         """Extract benefits table data"""
@@ -111,24 +363,62 @@ class HealthServiceParser:
             for row in rows[1:]:
                 cells = row.find_all('td')
                 if len(cells) >= 4:
-                    service_name = cells[0].get_text().strip()
-                    
-                    # Parse benefits for each HMO
-                    maccabi_benefits = self.parse_benefits_cell(cells[1].get_text())
-                    meuhedet_benefits = self.parse_benefits_cell(cells[2].get_text())
-                    clalit_benefits = self.parse_benefits_cell(cells[3].get_text())
-                    
-                    table_data[service_name] = {
-                        'מכבי': maccabi_benefits,
-                        'מאוחדת': meuhedet_benefits, 
-                        'כללית': clalit_benefits
-                    }
+                    self.add_table_row(table_data, [cell.get_text() for cell in cells[:4]])
         
         except Exception as e:
             logger.error(f"Error extracting table data: {e}")
         
         return table_data
     
+    def extract_table_data_lxml(self, tree) -> Dict:
+        """Extract benefits table data from an lxml tree with XPath"""
+        table_data = {}
+        
+        try:
+            tables = tree.xpath('(//table)[1]')
+            if not tables:
+                return table_data
+            
+            rows = tables[0].xpath('.//tr')
+            if len(rows) < 2:
+                return table_data
+            
+            # Extract data rows (the first row holds the headers)
+            for row in rows[1:]:
+                cells = row.xpath('.//td')
+                if len(cells) >= 4:
+                    self.add_table_row(table_data, [cell.text_content() for cell in cells[:4]])
+        
+        except Exception as e:
+            logger.error(f"Error extracting table data: {e}")
+        
+        return table_data
+    
+    def add_table_row(self, table_data: Dict, cell_texts: List[str]):
+        """Add a benefits table row from the text of its service name and HMO cells"""
+        service_name = cell_texts[0].strip()
+        
+        # Parse benefits for each HMO
+        maccabi_benefits = self.parse_benefits_cell(cell_texts[1])
+        meuhedet_benefits = self.parse_benefits_cell(cell_texts[2])
+        clalit_benefits = self.parse_benefits_cell(cell_texts[3])
+        
+        table_data[service_name] = {
+            'מכבי': maccabi_benefits,
+            'מאוחדת': meuhedet_benefits, 
+            'כללית': clalit_benefits
+        }
+    
+    def index_benefits(self, table_data: Dict) -> Dict:
+        """Group the benefits table by HMO and tier: {hmo: {tier: [(service_name, benefit_text), ...]}}"""
+        by_hmo_tier = {}
+        for service_name, benefits in table_data.items():
+            for hmo, tiers in benefits.items():
+                hmo_tiers = by_hmo_tier.setdefault(hmo, {})
+                for tier, benefit_text in tiers.items():
+                    hmo_tiers.setdefault(tier, []).append((service_name, benefit_text))
+        return by_hmo_tier
+    
     def parse_benefits_cell(self, cell_text: str) -> Dict:
         """Parse benefits for each insurance tier from table cell"""
         benefits = {'זהב': '', 'כסף': '', 'ארד': ''}
@@ -140,16 +430,11 @@ class HealthServiceParser:
             current_tier = None
             for line in lines:
                 # Check if line starts with tier name
-                if line.startswith('זהב:'):
-                    current_tier = 'זהב'
-                    benefits[current_tier] = line.replace('זהב:', '').strip()
-                elif line.startswith('כסף:'):
-                    current_tier = 'כסף' 
-                    benefits[current_tier] = line.replace('כסף:', '').strip()
-                elif line.startswith('ארד:'):
-                    current_tier = 'ארד'
-                    benefits[current_tier] = line.replace('ארד:', '').strip()
-                elif current_tier and not any(line.startswith(tier + ':') for tier in ['זהב', 'כסף', 'ארד']):
+                tier_match = TIER_PREFIX_RE.match(line)
+                if tier_match:
+                    current_tier = tier_match.group(1)
+                    benefits[current_tier] = line.replace(tier_match.group(), '').strip()
+                elif current_tier:
                     # Continuation of current tier
                     benefits[current_tier] += ' ' + line
         
@@ -173,19 +458,42 @@ class HealthServiceParser:
                     if next_ul:
                         li_elements = next_ul.find_all('li')
                         for li in li_elements:
-                            text = li.get_text()
-                            if 'מכבי:' in text:
-                                contact_info['מכבי'] = text.replace('מכבי:', '').strip()
-                            elif 'מאוחדת:' in text:
-                                contact_info['מאוחדת'] = text.replace('מאוחדת:', '').strip()
-                            elif 'כללית:' in text:
-                                contact_info['כללית'] = text.replace('כללית:', '').strip()
+                            self.add_contact_line(contact_info, li.get_text())
         
         except Exception as e:
             logger.error(f"Error extracting contact info: {e}")
         
         return contact_info
     
+    def extract_contact_info_lxml(self, tree) -> Dict:
+        """Extract contact information from an lxml tree"""
+        contact_info = {}
+        
+        try:
+            # Look for contact sections
+            for h3 in tree.iter('h3'):
+                h3_text = h3.text_content()
+                if 'טלפון' in h3_text or 'לפרטים' in h3_text:
+                    # Get the following ul element
+                    next_ul = next(h3.itersiblings('ul'), None)
+                    if next_ul is not None:
+                        for li in next_ul.iter('li'):
+                            self.add_contact_line(contact_info, li.text_content())
+        
+        except Exception as e:
+            logger.error(f"Error extracting contact info: {e}")
+        
+        return contact_info
+    
+    def add_contact_line(self, contact_info: Dict, text: str):
+        """Add the HMO contact details from one line of a contact list"""
+        if 'מכבי:' in text:
+            contact_info['מכבי'] = text.replace('מכבי:', '').strip()
+        elif 'מאוחדת:' in text:
+            contact_info['מאוחדת'] = text.replace('מאוחדת:', '').strip()
+        elif 'כללית:' in text:
+            contact_info['כללית'] = text.replace('כללית:', '').strip()
+    
     def get_service_benefits(self, service_type: str, hmo_name: str, tier: str, 
                            specific_service: Optional[str] = None) -> str:
         """Get benefits for specific service, HMO and tier"""
@@ -193,69 +501,24 @@ class HealthServiceParser:
         logger.info(f"Getting service benefits: service_type={service_type}, hmo_name={hmo_name}, tier={tier}")
         
         try:
-            if service_type not in self.services_data:
+            service_data = self.get_service(service_type)
+            if service_data is None:
                 logger.warning(f"Service type {service_type} not found in services_data")
                 return f"מצטער, לא נמצא מידע על שירותי {service_type}"
             
-            service_data = self.services_data[service_type]
             logger.info(f"Found service data for {service_type}")
             
-            if not service_data.get('benefits_table'):
-                logger.warning(f"No benefits_table found for {service_type}")
-                return f"מצטער, לא נמצא מידע על הטבות עבור {service_type}"
-            
-            benefits_table = service_data['benefits_table']
-            logger.info(f"Benefits table keys: {list(benefits_table.keys())}")
-            
-            # If specific service requested, look for it
-            if specific_service:
-                logger.info(f"Looking for specific service: {specific_service}")
-                for service_name, benefits in benefits_table.items():
-                    if specific_service.lower() in service_name.lower():
-                        logger.info(f"Found matching service: {service_name}")
-                        if hmo_name in benefits and tier in benefits[hmo_name]:
-                            benefit_text = benefits[hmo_name][tier]
-                            logger.info(f"Found benefit text: {benefit_text}")
-                            return f"עבור {service_name} ב{hmo_name} במסלול {tier}:\n{benefit_text}"
-                
-                logger.warning(f"No specific service found for: {specific_service}")
-                return f"לא נמצא מידע ספציפי על {specific_service}"
-            
-            # Return all benefits for the HMO and tier
-            response = f"ההטבות שלך עבור {service_data['title']} ב{hmo_name} במסלול {tier}:\n\n"
-            
-            found_benefits = False
-            for service_name, benefits in benefits_table.items():
-                logger.info(f"Processing service: {service_name}")
-                logger.info(f"  Available HMOs: {list(benefits.keys())}")
-                
-                if hmo_name in benefits:
-                    logger.info(f"  Found HMO {hmo_name}, available tiers: {list(benefits[hmo_name].keys())}")
-                    
-                    if tier in benefits[hmo_name]:
-                        benefit_text = benefits[hmo_name][tier]
-                        logger.info(f"  Found benefit for {tier}: {benefit_text}")
-                        
-                        if benefit_text.strip():
-                            response += f"• {service_name}: {benefit_text}\n\n"
-                            found_benefits = True
-                        else:
-                            logger.warning(f"  Empty benefit text for {service_name}")
-                    else:
-                        logger.warning(f"  Tier {tier} not found for {service_name} in {hmo_name}")
-                else:
-                    logger.warning(f"  HMO {hmo_name} not found for {service_name}")
-            
-            if not found_benefits:
-                logger.warning("No benefits found for the specified criteria")
-                return f"לא נמצאו הטבות עבור {hmo_name} במסלול {tier}"
-            
-            # Add contact info
-            if service_data.get('contact_info') and hmo_name in service_data['contact_info']:
-                response += f"\nליצירת קשר: {service_data['contact_info'][hmo_name]}"
-            
-            logger.info(f"Final response length: {len(response)}")
-            return response.strip()
+            # A loaded service doesn't change, so its responses are reused
+            cache_key = (service_type, hmo_name, tier, specific_service)
+            response = self.benefits_cache.get(cache_key)
+            if response is None:
+                response = self.compose_service_benefits(service_data, service_type, hmo_name,
+                                                         tier, specific_service)
+                if len(self.benefits_cache) >= BENEFITS_CACHE_SIZE:
+                    # Drop the oldest response
+                    del self.benefits_cache[next(iter(self.benefits_cache))]
+                self.benefits_cache[cache_key] = response
+            return response
             
         except Exception as e:
             logger.error(f"Error getting service benefits: {e}")
@@ -263,94 +526,113 @@ class HealthServiceParser:
             logger.error(traceback.format_exc())
             return "מצטער, אירעה שגיאה בחיפוש המידע"
     
+    def compose_service_benefits(self, service_data: ServiceData, service_type: str, hmo_name: str,
+                                 tier: str, specific_service: Optional[str]) -> str:
+        """Build the get_service_benefits response from the parsed service"""
+        if not service_data.benefits_table:
+            logger.warning(f"No benefits_table found for {service_type}")
+            return f"מצטער, לא נמצא מידע על הטבות עבור {service_type}"
+        
+        benefits_table = service_data.benefits_table
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Benefits table keys: {list(benefits_table.keys())}")
+        
+        # If specific service requested, look for it
+        if specific_service:
+            logger.info(f"Looking for specific service: {specific_service}")
+            for service_name, benefits in benefits_table.items():
+                if specific_service.lower() in service_name.lower():
+                    logger.info(f"Found matching service: {service_name}")
+                    if hmo_name in benefits and tier in benefits[hmo_name]:
+                        benefit_text = benefits[hmo_name][tier]
+                        logger.info(f"Found benefit text: {benefit_text}")
+                        return f"עבור {service_name} ב{hmo_name} במסלול {tier}:\n{benefit_text}"
+            
+            logger.warning(f"No specific service found for: {specific_service}")
+            return f"לא נמצא מידע ספציפי על {specific_service}"
+        
+        # Return all benefits for the HMO and tier (the response is built
+        # from parts and joined once)
+        response_parts = [f"ההטבות שלך עבור {service_data.title} ב{hmo_name} במסלול {tier}:\n\n"]
+        
+        found_benefits = False
+        # Services in table order, already narrowed down to this HMO and tier
+        tier_benefits = service_data.by_hmo_tier.get(hmo_name, {}).get(tier)
+        if tier_benefits is None:
+            logger.warning(f"  Tier {tier} in {hmo_name} not found in any service")
+        
+        for service_name, benefit_text in tier_benefits or ():
+            if debug:
+                logger.debug(f"  Found benefit for {service_name}: {benefit_text}")
+            
+            if benefit_text.strip():
+                response_parts.append(f"• {service_name}: {benefit_text}\n\n")
+                found_benefits = True
+            else:
+                logger.warning(f"  Empty benefit text for {service_name}")
+        
+        if not found_benefits:
+            logger.warning("No benefits found for the specified criteria")
+            return f"לא נמצאו הטבות עבור {hmo_name} במסלול {tier}"
+        
+        # Add contact info
+        if service_data.contact_info and hmo_name in service_data.contact_info:
+            response_parts.append(f"\nליצירת קשר: {service_data.contact_info[hmo_name]}")
+        
+        response = ''.join(response_parts)
+        logger.info(f"Final response length: {len(response)}")
+        return response.strip()
+    
+    def analyze_query(self, query: str) -> Dict:
+        """Matching services and hypothetical HMO and tier of a query, lowercasing it once"""
+        query_lower = query.lower()
+        return {
+            'service_matches': self.search_services_lower(query_lower),
+            'hypothetical_params': self.extract_hypothetical_params_lower(query_lower)
+        }
+    
     def search_services(self, query: str) -> List[str]:
         """Search for services matching the query"""
+        return self.search_services_lower(query.lower())
+    
+    def search_services_lower(self, query_lower: str) -> List[str]:
+        """Search for services matching the query (query_lower is the lowercased query)"""
         matches = []
         
-        query_lower = query.lower()
-        logger.info(f"Searching for services in query: '{query}' (lower: '{query_lower}')")
-        logger.info(f"Available service types: {list(self.services_data.keys())}")
+        logger.info(f"Searching for services in query: '{query_lower}'")
+        logger.info(f"Available service types: {list(self.service_files.keys())}")
         
-        # Search in service types
-        for service_type in self.services_data.keys():
-            logger.info(f"Checking service type: {service_type}")
-            
-            if any(keyword in service_type for keyword in ['dental', 'dentel', 'שיניים']):
-                if any(keyword in query_lower for keyword in ['שיניים', 'dental', 'דנטל', 'שן', 'טיפולי שיניים']):
-                    logger.info(f"Matched dental service: {service_type}")
-                    matches.append('dentel')
-            elif any(keyword in service_type for keyword in ['optometry', 'אופטומטריה']):
-                if any(keyword in query_lower for keyword in ['עיניים', 'ראייה', 'משקפיים', 'עדשות', 'optometry', 'בדיקות ראייה']):
-                    logger.info(f"Matched optometry service: {service_type}")
-                    matches.append('optometry')
-            elif any(keyword in service_type for keyword in ['pregnancy', 'pragrency', 'הריון']):
-                pregnancy_keywords = ['הריון', 'לידה', 'pregnancy', 'בריאות האישה', 'נשים הרות', 'הרות', 'מעקב הריון']
-                logger.info(f"Checking pregnancy keywords: {pregnancy_keywords}")
-                for keyword in pregnancy_keywords:
-                    if keyword in query_lower:
-                        logger.info(f"Found pregnancy keyword '{keyword}' in query")
-                        matches.append('pragrency')
-                        break
-            elif any(keyword in service_type for keyword in ['alternative', 'אלטרנטיב']):
-                if any(keyword in query_lower for keyword in ['אלטרנטיב', 'רפואה משלימה', 'alternative']):
-                    logger.info(f"Matched alternative service: {service_type}")
-                    matches.append('alternative')
-            elif any(keyword in service_type for keyword in ['communication', 'תקשורת']):
-                if any(keyword in query_lower for keyword in ['תקשורת', 'דיבור', 'שמיעה', 'communication']):
-                    logger.info(f"Matched communication service: {service_type}")
-                    matches.append('communication_clinic')
-            elif any(keyword in service_type for keyword in ['workshops', 'סדנאות']):
-                if any(keyword in query_lower for keyword in ['סדנאות', 'הרצאות', 'workshops', 'קורסים']):
-                    logger.info(f"Matched workshops service: {service_type}")
-                    matches.append('workshops')
+        # Scan the query for every keyword once
+        found = find_search_matches(query_lower)
+        
+        # Search in service types (only their names are needed, nothing is parsed)
+        for service_type in self.service_files.keys():
+            match = search_match_for(service_type)
+            if match in found:
+                logger.info(f"Matched {match} service: {service_type}")
+                matches.append(match)
         
         logger.info(f"Final matches: {matches}")
         return matches
     
     def extract_hypothetical_params(self, query: str) -> Dict[str, Optional[str]]:
         """Extract hypothetical HMO and tier from user query"""
-        import re
-        
-        query_lower = query.lower()
-        result = {'hmo': None, 'tier': None}
-        
-        # Detect hypothetical scenarios
-        hypothetical_phrases = [
-            'אם הייתי', 'לו הייתי', 'אילו הייתי', 'מה אם', 'מה לו',
-            'if i was', 'if i were', 'what if', 'suppose i was'
-        ]
-        
-        is_hypothetical = any(phrase in query_lower for phrase in hypothetical_phrases)
+        return self.extract_hypothetical_params_lower(query.lower())
+    
+    def extract_hypothetical_params_lower(self, query_lower: str) -> Dict[str, Optional[str]]:
+        """Extract hypothetical HMO and tier from user query (query_lower is the lowercased query)"""
+        # A query is hypothetical if it has a hypothetical phrase ("אם הייתי",
+        # "what if", ...) or mentions any HMO or tier. The HMO and tier can only
+        # be extracted from such a mention, so finding the mentions is enough
+        mentioned = {HYPOTHETICAL_MENTIONS[word] for word in hypothetical_mention_pattern().findall(query_lower)}
         
-        if not is_hypothetical:
-            # Check for direct tier/HMO mentions that might be hypothetical
-            tier_mentions = ['זהב', 'כסף', 'ארד', 'gold', 'silver', 'bronze']
-            hmo_mentions = ['מכבי', 'מאוחדת', 'כללית', 'maccabi', 'meuhedet', 'clalit']
-            
-            # If tier or HMO is mentioned, consider it potentially hypothetical
-            if any(tier in query_lower for tier in tier_mentions) or any(hmo in query_lower for hmo in hmo_mentions):
-                is_hypothetical = True
-        
-        if is_hypothetical:
-            # Extract HMO
-            if any(word in query_lower for word in ['מכבי', 'maccabi']):
-                result['hmo'] = 'מכבי'
-            elif any(word in query_lower for word in ['מאוחדת', 'meuhedet']):
-                result['hmo'] = 'מאוחדת'
-            elif any(word in query_lower for word in ['כללית', 'clalit']):
-                result['hmo'] = 'כללית'
-            
-            # Extract tier
-            if any(word in query_lower for word in ['זהב', 'gold']):
-                result['tier'] = 'זהב'
-            elif any(word in query_lower for word in ['כסף', 'silver']):
-                result['tier'] = 'כסף'
-            elif any(word in query_lower for word in ['ארד', 'bronze']):
-                result['tier'] = 'ארד'
-        
-        return result
+        return {
+            'hmo': next((hmo for hmo in HMO_ORDER if hmo in mentioned), None),
+            'tier': next((tier for tier in TIER_ORDER if tier in mentioned), None)
+        }
     
     def get_available_services(self) -> List[str]:
         """Get list of available service types"""
-        return list(self.services_data.keys())
+        return list(self.service_files.keys())
 